@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# dptrp1manager, high level tools to interact with the Sony DPT-RP1
+# Copyright © 2018 Christian Gross
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import os.path as osp
+import select
+import socket
+import struct
+import sys
+import time
+
+# Detect the device on USB and wait for its network interface. On linux the
+# usb devices are read from sysfs and the interface addresses from procfs, and
+# waiting for an interface blocks on netlink events. Elsewhere the addresses
+# are read with psutil, and without netlink they are polled.
+
+USB_DEVICES = "/sys/bus/usb/devices"
+IF_INET6 = "/proc/net/if_inet6"
+SONY_VENDOR_ID = "054c"
+
+# linux/rtnetlink.h
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+# linux/if_addr.h, the address cannot be used before duplicate address
+# detection is done
+IFA_F_TENTATIVE = 0x40
+# linux/sockios.h
+SIOCGIFADDR = 0x8915
+
+POLL_INTERVAL = 0.3
+
+
+def _is_linux():
+    return sys.platform.startswith("linux")
+
+
+def usb_devices():
+    """List the connected usb devices.
+
+    Returns
+    -------
+    list
+        (vendor id, product id) of every device as hex strings, e.g.
+        ("054c", "0c1c").
+
+    """
+    res = []
+    try:
+        names = os.listdir(USB_DEVICES)
+    except OSError:
+        return res
+    for name in names:
+        try:
+            with open(osp.join(USB_DEVICES, name, "idVendor")) as f:
+                vendor = f.read().strip()
+            with open(osp.join(USB_DEVICES, name, "idProduct")) as f:
+                product = f.read().strip()
+        except OSError:
+            # interfaces of a device have no ids
+            continue
+        res.append((vendor, product))
+    return res
+
+
+def sony_usb_connected():
+    """Check if a Sony device is connected by USB. **this is linux specific!**
+
+    """
+    return any(vendor == SONY_VENDOR_ID for vendor, _ in usb_devices())
+
+
+def _has_inet6(interface):
+    try:
+        with open(IF_INET6) as f:
+            for line in f:
+                fields = line.split()
+                if (
+                    len(fields) == 6
+                    and fields[5] == interface
+                    and not int(fields[4], 16) & IFA_F_TENTATIVE
+                ):
+                    return True
+    except OSError:
+        pass
+    return False
+
+
+def _has_inet(interface):
+    import fcntl
+
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        fcntl.ioctl(
+            s.fileno(), SIOCGIFADDR, struct.pack("256s", interface[:15].encode())
+        )
+        return True
+    except OSError:
+        # no such interface or no address
+        return False
+    finally:
+        s.close()
+
+
+def interface_up(interface):
+    """Check if the net interface has a usable IPv4 or IPv6 address.
+
+    """
+    if _is_linux():
+        return _has_inet6(interface) or _has_inet(interface)
+    import psutil
+
+    addrs = psutil.net_if_addrs().get(interface) or []
+    return any(a.family in (socket.AF_INET, socket.AF_INET6) for a in addrs)
+
+
+def _netlink_socket():
+    """A socket receiving link and address changes, None if not available.
+
+    """
+    if not _is_linux():
+        return None
+    try:
+        s = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    except (AttributeError, OSError):
+        return None
+    try:
+        s.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+    except OSError:
+        s.close()
+        return None
+    return s
+
+
+def wait_for_interface(interface, timeout, cancel=None):
+    """Wait until the net interface is up.
+
+    Blocks on netlink events and returns as soon as the interface has an
+    address. Without netlink the interface is polled.
+
+    Parameters
+    ----------
+    interface : string
+    timeout : float
+        Max. seconds to wait.
+    cancel : threading.Event (None)
+        Give up when it is set. It is checked at least every 0.3 s.
+
+    Returns
+    -------
+    bool
+        True if the interface is up.
+
+    """
+    deadline = time.monotonic() + timeout
+    nl = _netlink_socket()
+    try:
+        # subscribed before the check, no event is missed in between
+        while not interface_up(interface):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (cancel is not None and cancel.is_set()):
+                return False
+            if nl is None:
+                time.sleep(min(POLL_INTERVAL, remaining))
+                continue
+            ready, _, _ = select.select([nl], [], [], min(POLL_INTERVAL, remaining))
+            if ready:
+                # any change is a reason to check again, no need to parse it
+                nl.recv(65536)
+        return True
+    finally:
+        if nl is not None:
+            nl.close()
@@ -18,7 +18,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+import io
+import json
 import os.path as osp
+import sys
+import threading
+import time
 
 
 class DPConfig(object):
@@ -28,11 +35,135 @@ class DPConfig(object):
     ----------
     dp_mgr : DPManager
 
+    Attributes
+    ----------
+    status_ttl : float
+        Seconds the answers of the status endpoints are reused by the status
+        properties.
+
     """
 
+    # status endpoint: getter of MyDigitalPaper
+    STATUS_ENDPOINTS = {
+        "storage": "get_storage",
+        "battery": "get_battery",
+        "info": "get_info",
+        "firmware_version": "get_firmware_version",
+        "mac_address": "get_mac_address",
+    }
+
+    # parameter: name of the setting on the device
+    CONFIG_PARAMETERS = {
+        "timeout": "timeout_to_standby",
+        "owner": "owner",
+        "time_format": "time_format",
+        "date_format": "date_format",
+        "timezone": "timezone",
+    }
+
     def __init__(self, dp_mgr):
         super(DPConfig, self).__init__()
         self._dp_mgr = dp_mgr
+        self.status_ttl = 2.0
+        # endpoint: (time.monotonic() of the request, answer)
+        self._status_cache = {}
+        self._status_lock = threading.Lock()
+
+    def _status(self, endpoint):
+        """The answer of a status endpoint, cached for status_ttl seconds.
+
+        """
+        with self._status_lock:
+            cached = self._status_cache.get(endpoint)
+        if cached is not None and time.monotonic() - cached[0] < self.status_ttl:
+            return cached[1]
+        t = time.monotonic()
+        data = getattr(self._dp_mgr.dp, self.STATUS_ENDPOINTS[endpoint])()
+        with self._status_lock:
+            self._status_cache[endpoint] = (t, data)
+        return data
+
+    def snapshot(self):
+        """Read all status endpoints at once, concurrently.
+
+        The answers are cached, the status properties read within status_ttl
+        seconds need no further requests.
+
+        Returns
+        -------
+        dict
+            The value of every status property.
+
+        """
+        with self._status_lock:
+            self._status_cache.clear()
+        with ThreadPoolExecutor(max_workers=len(self.STATUS_ENDPOINTS)) as executor:
+            list(executor.map(self._status, self.STATUS_ENDPOINTS))
+        return {
+            "storage_free": self.storage_free,
+            "storage_total": self.storage_total,
+            "battery_level": self.battery_level,
+            "battery_pen": self.battery_pen,
+            "battery_health": self.battery_health,
+            "battery_status": self.battery_status,
+            "plugged": self.plugged,
+            "model": self.model,
+            "serial": self.serial,
+            "firmware_version": self.firmware_version,
+            "mac_address": self.mac_address,
+        }
+
+    def get_all(self):
+        """Read all configuration parameters concurrently.
+
+        Returns
+        -------
+        dict
+            parameter: value
+
+        """
+        values = self._dp_mgr.dp.get_configs(self.CONFIG_PARAMETERS.values())
+        return {par: values[name] for par, name in self.CONFIG_PARAMETERS.items()}
+
+    def set_all(self, values, verify=True):
+        """Set several configuration parameters concurrently.
+
+        Parameters
+        ----------
+        values : dict
+            parameter: value, e.g. as read by load_profile.
+        verify : bool (True)
+            Read the parameters back and check them.
+
+        Returns
+        -------
+        bool
+            True if all parameters were set.
+
+        """
+        unknown = [par for par in values if par not in self.CONFIG_PARAMETERS]
+        if unknown:
+            print("ERROR: Unknown parameters {}".format(", ".join(unknown)))
+            return False
+        failed = self._dp_mgr.dp.set_configs(
+            {self.CONFIG_PARAMETERS[par]: val for par, val in values.items()}, verify
+        )
+        for par, val in values.items():
+            name = self.CONFIG_PARAMETERS[par]
+            if name not in failed:
+                continue
+            if failed[name] is None:
+                print("ERROR: Setting {} to {} failed.".format(par, val))
+            else:
+                print("ERROR: {} is {} instead of {}.".format(par, failed[name], val))
+        return not failed
+
+    def save_profile(self, path):
+        """Save all configuration parameters to a json file.
+
+        """
+        with open(osp.expanduser(path), "w") as f:
+            json.dump(self.get_all(), f, indent=2, sort_keys=True)
 
     @property
     def templates(self):
@@ -73,7 +204,7 @@ class DPConfig(object):
 
     @timeout.setter
     def timeout(self, val):
-        self.dp._dp_mgr.set_timeout(val)
+        self._dp_mgr.dp.set_timeout(val)
 
     @property
     def owner(self):
@@ -128,7 +259,7 @@ class DPConfig(object):
         """Free space on device in Byte
 
         """
-        storage = self._dp_mgr.dp.get_storage()
+        storage = self._status("storage")
         free = float(storage["available"])
         return free
 
@@ -137,7 +268,7 @@ class DPConfig(object):
         """Total storage capacity in Byte
 
         """
-        storage = self._dp_mgr.dp.get_storage()
+        storage = self._status("storage")
         total = float(storage["capacity"])
         return total
 
@@ -146,7 +277,7 @@ class DPConfig(object):
         """Battery level in percent.
 
         """
-        battery = self._dp_mgr.dp.get_battery()
+        battery = self._status("battery")
         return battery["level"]
 
     @property
@@ -154,7 +285,7 @@ class DPConfig(object):
         """Pen battery level in percent.
 
         """
-        battery = self._dp_mgr.dp.get_battery()
+        battery = self._status("battery")
         return battery["pen"]
 
     @property
@@ -162,7 +293,7 @@ class DPConfig(object):
         """Battery health
 
         """
-        battery = self._dp_mgr.dp.get_battery()
+        battery = self._status("battery")
         return battery["health"]
 
     @property
@@ -170,7 +301,7 @@ class DPConfig(object):
         """Battery status (charging/discharging)
 
         """
-        battery = self._dp_mgr.dp.get_battery()
+        battery = self._status("battery")
         return battery["status"]
 
     @property
@@ -178,7 +309,7 @@ class DPConfig(object):
         """Check if connected via usb for charging.
 
         """
-        battery = self._dp_mgr.dp.get_battery()
+        battery = self._status("battery")
         return battery["plugged"]
 
     @property
@@ -186,7 +317,7 @@ class DPConfig(object):
         """The model name
 
         """
-        info = self._dp_mgr.dp.get_info()
+        info = self._status("info")
         return info["model_name"]
 
     @property
@@ -194,7 +325,7 @@ class DPConfig(object):
         """The seral number of the device
 
         """
-        info = self._dp_mgr.dp.get_info()
+        info = self._status("info")
         return info["serial_number"]
 
     @property
@@ -202,7 +333,7 @@ class DPConfig(object):
         """Get the firmware version
 
         """
-        fw_version = self._dp_mgr.dp.get_firmware_version()
+        fw_version = self._status("firmware_version")
         return fw_version
 
     @property
@@ -210,7 +341,7 @@ class DPConfig(object):
         """The mac address
 
         """
-        mac_address = self._dp_mgr.dp.get_mac_address()
+        mac_address = self._status("mac_address")
         return mac_address
 
     def list_wifi(self):
@@ -306,3 +437,94 @@ class DPConfig(object):
 
     def disable_wifi(self):
         self._dp_mgr.dp.disable_wifi()
+
+
+def load_profile(path):
+    """Read configuration parameters saved by DPConfig.save_profile.
+
+    Returns
+    -------
+    dict
+        parameter: value
+
+    """
+    with open(osp.expanduser(path)) as f:
+        return json.load(f)
+
+
+def provision(addrs, values, verify=True, jobs=4):
+    """Set the configuration parameters of several devices concurrently.
+
+    Parameters
+    ----------
+    addrs : list
+        Addresses of the devices, the client must be registered with each.
+    values : dict
+        parameter: value
+    verify : bool (True)
+        Read the parameters back and check them.
+    jobs : int (4)
+        Number of devices configured at the same time.
+
+    Returns
+    -------
+    dict
+        address: (True if all parameters were set, output of the device)
+
+    """
+    from dptrp1manager import dptman
+
+    # the managers share the config and cache files, they are created one at
+    # a time
+    create_lock = threading.Lock()
+    output = _ThreadOutput(sys.stdout)
+
+    def configure(addr):
+        buf = output.capture()
+        try:
+            with create_lock:
+                dp_mgr = dptman.DPManager(ip=addr, load_tree=False)
+            ok = DPConfig(dp_mgr).set_all(values, verify)
+        except SystemExit:
+            # DPManager exits if the device cannot be reached
+            ok = False
+        except Exception as e:
+            # e.g. the client is not registered with the device, the other
+            # devices are configured anyway
+            print("ERROR: {!r}".format(e))
+            ok = False
+        return ok, buf.getvalue()
+
+    with redirect_stdout(output), ThreadPoolExecutor(max_workers=jobs) as executor:
+        return dict(zip(addrs, executor.map(configure, addrs)))
+
+
+class _ThreadOutput(object):
+    """Stand-in for sys.stdout which keeps the output of each thread apart.
+
+    Threads that did not call capture write to the original stream.
+
+    """
+
+    def __init__(self, stream):
+        super(_ThreadOutput, self).__init__()
+        self._stream = stream
+        self._local = threading.local()
+
+    def capture(self):
+        """Collect the output of the calling thread from now on.
+
+        Returns
+        -------
+        io.StringIO
+            The buffer receiving the output.
+
+        """
+        self._local.buffer = io.StringIO()
+        return self._local.buffer
+
+    def write(self, text):
+        return getattr(self._local, "buffer", self._stream).write(text)
+
+    def flush(self):
+        getattr(self._local, "buffer", self._stream).flush()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# dptrp1manager, high level tools to interact with the Sony DPT-RP1
+# Copyright © 2018 Christian Gross
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from contextlib import redirect_stderr, redirect_stdout
+import json
+import os
+import os.path as osp
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+
+
+CONFIGDIR = osp.join(osp.expanduser("~"), ".dpmgr")
+SOCKET_PATH = osp.join(CONFIGDIR, "dpmgrd.sock")
+
+# The protocol is one json object per line. The client sends
+# {"argv": [...], "cwd": ...} and answers {"input": true} with {"line": ...}.
+# The daemon sends {"out": ...} for the output of the command, {"input": true}
+# when the command reads a line and finally {"exit": code}.
+
+
+class _ClientIO(object):
+    """stdout and stdin of a command, forwarded to the client.
+
+    """
+
+    def __init__(self, rfile, wfile):
+        super(_ClientIO, self).__init__()
+        self._rfile = rfile
+        self._wfile = wfile
+
+    def send(self, msg):
+        self._wfile.write((json.dumps(msg) + "\n").encode("utf-8"))
+        self._wfile.flush()
+
+    def receive(self):
+        line = self._rfile.readline()
+        if not line:
+            return None
+        return json.loads(line.decode("utf-8"))
+
+    def write(self, text):
+        if text:
+            self.send({"out": text})
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        self.send({"input": True})
+        msg = self.receive()
+        if msg is None:
+            # EOF, input() raises EOFError
+            return ""
+        return msg.get("line", "")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        io = _ClientIO(self.rfile, self.wfile)
+        try:
+            request = io.receive()
+        except ValueError:
+            return
+        if request is None or "argv" not in request:
+            return
+        code = self.server.daemon.run(request["argv"], request.get("cwd"), io)
+        try:
+            io.send({"exit": code})
+        except OSError:
+            # the client went away
+            pass
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class DPDaemon(object):
+    """Serve dpmgr commands over a Unix socket with one connected DPManager.
+
+    The authenticated session and the tree of the device are kept between
+    commands. Commands are run one at a time, the tree is refreshed in the
+    background between them.
+
+    Parameters
+    ----------
+    dp_mgr : DPManager
+    run_command : callable
+        Called as run_command(argv, dp_mgr) to run a dpmgr command line.
+    refresh : float (60)
+        Seconds between refreshes of the tree, 0 to disable them.
+    path : string
+        Path of the socket.
+
+    """
+
+    def __init__(self, dp_mgr, run_command, refresh=60, path=SOCKET_PATH):
+        super(DPDaemon, self).__init__()
+        self.dp_mgr = dp_mgr
+        self._run_command = run_command
+        self.refresh = refresh
+        self.path = path
+        # commands and refreshes use the manager one at a time
+        self._lock = threading.Lock()
+        # counts the commands, a refresh read before a command is outdated
+        self._generation = 0
+
+    def serve_forever(self):
+        if osp.exists(self.path):
+            if ping(self.path):
+                print("ERROR: dpmgrd is already running on {}".format(self.path))
+                sys.exit(1)
+            # left over from a daemon which did not shut down
+            os.remove(self.path)
+        umask = os.umask(0o177)
+        try:
+            server = _Server(self.path, _Handler)
+        finally:
+            os.umask(umask)
+        server.daemon = self
+        if self.refresh > 0:
+            threading.Thread(target=self._refresh_loop, daemon=True).start()
+        print("dpmgrd listening on {}".format(self.path))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(self.path)
+
+    def _refresh_loop(self):
+        """Refresh the tree periodically.
+
+        The device is read without holding the lock, such that commands are
+        not blocked meanwhile. The result is swapped in under the lock, unless
+        a command ran in between and may have changed the device.
+
+        """
+        while True:
+            time.sleep(self.refresh)
+            with self._lock:
+                # after a running command
+                generation = self._generation
+            try:
+                update = self.dp_mgr.fetch_tree_update()
+            except Exception:
+                traceback.print_exc()
+                continue
+            with self._lock:
+                if self._generation != generation:
+                    # read again at the next refresh
+                    continue
+                try:
+                    self.dp_mgr.apply_tree_update(update)
+                except Exception:
+                    traceback.print_exc()
+
+    def run(self, argv, cwd, io):
+        """Run a command with its output and input forwarded to io.
+
+        Returns
+        -------
+        int
+            The exit code of the command.
+
+        """
+        with self._lock:
+            self._generation += 1
+            stdin = sys.stdin
+            oldcwd = os.getcwd()
+            code = 0
+            try:
+                if cwd is not None:
+                    os.chdir(cwd)
+                sys.stdin = io
+                with redirect_stdout(io), redirect_stderr(io):
+                    try:
+                        self._run_command(argv, self.dp_mgr)
+                    except SystemExit as e:
+                        code = e.code
+                    except OSError as e:
+                        # e.g. the client closed the connection
+                        print("ERROR: {}".format(e), file=sys.__stderr__)
+                        code = 1
+                    except Exception as e:
+                        print("ERROR: {}".format(e))
+                        traceback.print_exc()
+                        code = 1
+            finally:
+                sys.stdin = stdin
+                os.chdir(oldcwd)
+        if code is None:
+            code = 0
+        elif not isinstance(code, int):
+            io.write("{}\n".format(code))
+            code = 1
+        return code
+
+
+def ping(path=SOCKET_PATH):
+    """Check if a daemon accepts connections on path.
+
+    """
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+
+def run_client(argv, path=SOCKET_PATH):
+    """Run a dpmgr command line in the daemon.
+
+    Returns
+    -------
+    int or None
+        The exit code of the command, or None if no daemon is running.
+
+    """
+    if not osp.exists(path):
+        return None
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except OSError:
+        s.close()
+        return None
+    with s, s.makefile("rb") as rfile, s.makefile("wb") as wfile:
+        io = _ClientIO(rfile, wfile)
+        io.send({"argv": argv, "cwd": os.getcwd()})
+        while True:
+            msg = io.receive()
+            if msg is None:
+                print("ERROR: Lost the connection to dpmgrd.")
+                return 1
+            if "out" in msg:
+                sys.stdout.write(msg["out"])
+                sys.stdout.flush()
+            elif "input" in msg:
+                io.send({"line": sys.stdin.readline()})
+            elif "exit" in msg:
+                return msg["exit"]
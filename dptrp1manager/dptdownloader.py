@@ -18,19 +18,29 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from concurrent.futures import ThreadPoolExecutor
 import os
 import os.path as osp
 
+import requests
+
 from dptrp1manager.dptfthandler import FileTransferHandler
 
 
 class Downloader(FileTransferHandler):
     """Manage downloading of files.
 
+    Parameters
+    ----------
+    dp_mgr : DPManager
+    jobs : int (1)
+        Number of documents downloaded concurrently.
+
     """
 
-    def __init__(self, dp_mgr):
+    def __init__(self, dp_mgr, jobs=1):
         super(Downloader, self).__init__(dp_mgr)
+        self.jobs = jobs
 
     def download_file(self, source, dest, policy="skip"):
         """Download a file from the DPT-RP1.
@@ -44,12 +54,39 @@ class Downloader(FileTransferHandler):
         policy : 'remote_wins', 'local_wins', 'newer', 'skip'
             Decide what to do if the file is already present.
 
+        """
+        job = self._prepare_download(source, dest, policy)
+        if job is not None:
+            self._run_downloads([job])
+
+    def download_files(self, sources, dest, policy="skip"):
+        """Download several files from the DPT-RP1 into the folder dest.
+
+        """
+        jobs = []
+        for source in sources:
+            job = self._prepare_download(source, dest, policy)
+            if job is not None:
+                jobs.append(job)
+        self._run_downloads(jobs)
+
+    def _prepare_download(self, source, dest, policy):
+        """Check if a file should be downloaded.
+
+        Returns
+        -------
+        tuple
+            (source, remote node, dest) if the file is to be downloaded, else
+            None.
+
         """
         dest = osp.expanduser(dest)
         if osp.isdir(dest):
             # take the filename from remote
             dest = osp.join(dest, source.rsplit("/")[-1])
         source = self._dp_mgr.fix_path(source)
+        if self._journal_completed("download", source, dest):
+            return None
         source_node = self._dp_mgr.get_node(source)
         if (
             self._check_policy(policy)
@@ -92,12 +129,53 @@ class Downloader(FileTransferHandler):
                             "SKIP: Skipping download of {}".format(osp.basename(source))
                         )
             if do_transfer:
-                print("Downloading {}".format(source))
-                data = self._dp_mgr.dp.download_byid(source_node.entry_id)
-                with open(dest, "wb") as f:
-                    f.write(data)
+                return source, source_node, dest
         else:
             print("ERROR: Failed downloading {}. File not found.".format(source))
+        return None
+
+    def _run_downloads(self, jobs):
+        """Download the prepared jobs, concurrently if jobs > 1.
+
+        The results are reported in the order of the jobs.
+
+        """
+        if self.journal is not None:
+            for source, _, dest in jobs:
+                self.journal.plan("download", source, dest)
+        if self.jobs > 1 and len(jobs) > 1:
+            self._dp_mgr.dp.set_pool_size(self.jobs)
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = [executor.submit(self._download, job) for job in jobs]
+                for job, future in zip(jobs, futures):
+                    self._report(job, future.result())
+        else:
+            for job in jobs:
+                print("Downloading {}".format(job[0]))
+                self._report(job, self._download(job), quiet=True)
+
+    def _download(self, job):
+        """Download a single file, return None on success or the error.
+
+        """
+        source, node, dest = job
+        try:
+            if self._dp_mgr.dp.download_byid_to_file(
+                node.entry_id, dest, node.file_size, node.file_revision
+            ):
+                if self.journal is not None:
+                    self.journal.complete("download", source, dest)
+                return None
+            return "request failed"
+        except (requests.exceptions.RequestException, OSError) as e:
+            return e
+
+    def _report(self, job, error, quiet=False):
+        source = job[0]
+        if error is not None:
+            print("ERROR: Failed downloading {}: {}".format(source, error))
+        elif not quiet:
+            print("Downloaded {}".format(source))
 
     def download_folder_contents(self, source, dest, policy="skip"):
         """Download a full folder from the DPT-RP1.
@@ -108,16 +186,28 @@ class Downloader(FileTransferHandler):
         if self._check_policy(policy) and self._dp_mgr.node_exists(source):
             src_files = self._dp_mgr.get_folder_contents(source)
             if self._local_path_ok(dest):
+                jobs = []
                 for f in src_files:
                     if f.entry_type == "document":
-                        self.download_file(
+                        job = self._prepare_download(
                             f.entry_path, osp.join(dest, f.entry_name), policy
                         )
+                        if job is not None:
+                            jobs.append(job)
+                self._run_downloads(jobs)
 
     def download_recursively(self, source, dest, policy="skip"):
         """Download recursively.
 
+        The local folders are created first, the files are downloaded
+        afterwards.
+
         """
+        jobs = []
+        self._prepare_recursively(source, dest, policy, jobs)
+        self._run_downloads(jobs)
+
+    def _prepare_recursively(self, source, dest, policy, jobs):
         dest = osp.expanduser(dest)
         source = self._dp_mgr.fix_path(source)
         if not self._local_path_ok(dest):
@@ -126,11 +216,15 @@ class Downloader(FileTransferHandler):
             src_nodes = self._dp_mgr.get_folder_contents(source)
             for f in src_nodes:
                 if f.entry_type == "document":
-                    self.download_file(
+                    job = self._prepare_download(
                         f.entry_path, osp.join(dest, f.entry_name), policy
                     )
+                    if job is not None:
+                        jobs.append(job)
                 else:
                     new_local_path = osp.join(dest, f.entry_name)
                     if not self._local_path_ok(new_local_path, printerr=False):
                         os.mkdir(new_local_path)
-                    self.download_recursively(f.entry_path, new_local_path, policy)
+                    self._prepare_recursively(
+                        f.entry_path, new_local_path, policy, jobs
+                    )
@@ -29,11 +29,27 @@ class FileTransferHandler(object):
     ----------
     dp_mgr : DPManager
 
+    Attributes
+    ----------
+    journal : TransferJournal or None
+        If set, transfers are recorded and those already completed are
+        skipped.
+
     """
 
     def __init__(self, dp_mgr):
         super(FileTransferHandler, self).__init__()
         self._dp_mgr = dp_mgr
+        self.journal = None
+
+    def _journal_completed(self, kind, source, dest):
+        """Check if the journal has the transfer as completed.
+
+        """
+        if self.journal is not None and self.journal.is_completed(kind, source, dest):
+            print("RESUME: Skipping completed {} of {}".format(kind, source))
+            return True
+        return False
 
     def _check_newer(self, local, remote):
         """Check if the local or remote file is newer.
@@ -22,20 +22,28 @@ import sys
 import os
 import os.path as osp
 import configparser
-import subprocess
-import re
+import json
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import socket
-import psutil
+import tempfile
+import threading
 import time
 import requests
 
-import serial
-import anytree
-from dptrp1manager import tools, remotetree, mydptrp1
+from dptrp1manager import detect, mydptrp1
+
+# serial, anytree and remotetree are imported where they are used, most
+# commands need only some of them.
 
 
 CONFIGDIR = osp.join(osp.expanduser("~"), ".dpmgr")
 
+# session.json is shared by the managers of several devices in one process,
+# see dptconfig.provision
+_session_lock = threading.Lock()
+
 # on usb
 # dptrp1  --addr "[fe80::b47f:46ff:fe5d:7741%enp0s20f0u2]" list-documents
 
@@ -51,6 +59,16 @@ class DPManager(object):
     register : bool (False)
         If True, force registration of the client even if key and id files are
         found.
+    use_cache : bool (False)
+        If True, use the cached contents of the device if they are younger than
+        the ttl set in the CACHE section of the config file. Meant for read
+        only commands.
+    offline : bool (False)
+        If True, do not connect to the device at all and use the cached
+        contents regardless of their age. `dp` is None then.
+    load_tree : bool (True)
+        If False, only authenticate. The contents of the device are read when
+        the tree is first needed, `mkdir` reads only the folders on the path.
 
     Attributes
     ----------
@@ -59,24 +77,97 @@ class DPManager(object):
 
     """
 
-    def __init__(self, ip="", register=False):
+    def __init__(
+        self, ip="", register=False, use_cache=False, offline=False, load_tree=True
+    ):
         super(DPManager, self).__init__()
         self._config = configparser.ConfigParser()
         self._checkconfigfile()
+        self._tree_cache_file = osp.join(CONFIGDIR, "remote_tree.json")
+        self._route_file = osp.join(CONFIGDIR, "route.json")
+        self._remote_tree = None
+        # folder id: fingerprint of its entries when last listed
+        self._fingerprints = {}
+        self._serial = None
+        self._use_cache = use_cache
+        if offline:
+            self.dp = None
+            print("Offline: reading contents from the cache")
+            if not self._load_tree_cache():
+                print("ERROR: No cached contents of the device found.")
+                sys.exit(1)
+            return
         addr = self._get_ip(ip)
         print("Attempting connection to ip {}".format(addr))
         self.dp = mydptrp1.MyDigitalPaper(addr)
         if self.dp is None:
             sys.exit(1)
+        self._configure_session()
         self._key_file = osp.join(CONFIGDIR, "dptrp1_key")
         self._clientid_file = osp.join(CONFIGDIR, "dptrp1_id")
-        self._resolver = anytree.resolver.Resolver("name")
-        self._remote_tree = None
+        self._session_file = osp.join(CONFIGDIR, "session.json")
 
         self._check_registered(register)
         self._authenticate()
-        print("Reading contents of the device")
-        self._build_tree()
+        if load_tree:
+            self._load_tree()
+
+    def _load_tree(self):
+        """Build the tree from the cache or the device, see __init__.
+
+        """
+        cache_config = self._config["CACHE"]
+        if not (
+            self._use_cache
+            and self._load_tree_cache(
+                cache_config.getfloat("ttl", fallback=300), self.serial
+            )
+        ):
+            print("Reading contents of the device")
+            if cache_config.getboolean(
+                "incremental", fallback=False
+            ) and self._load_tree_cache(serial=self.serial):
+                self.refresh_tree()
+            else:
+                self._build_tree()
+
+    def update_tree(self):
+        """Read the contents of the device again.
+
+        The loaded tree is refreshed folder by folder if incremental is set in
+        the CACHE section, otherwise the whole device is listed.
+
+        """
+        self.apply_tree_update(self.fetch_tree_update())
+
+    def fetch_tree_update(self):
+        """Read the contents of the device for `update_tree`, without changing
+        the tree.
+
+        The result is applied with `apply_tree_update`, which is quick. In
+        between the tree must not be changed.
+
+        Returns
+        -------
+        tuple
+            ("folders", changed folders) if incremental is set in the CACHE
+            section and a tree is loaded, else ("all", all entries).
+
+        """
+        incremental = self._config["CACHE"].getboolean("incremental", fallback=False)
+        if incremental and self._remote_tree is not None:
+            return "folders", self._list_changed_folders()
+        return "all", self._get_all_contents()
+
+    def apply_tree_update(self, update):
+        """Update the tree with the result of `fetch_tree_update`.
+
+        """
+        kind, data = update
+        if kind == "folders":
+            self._apply_changed_folders(data)
+        else:
+            self._set_tree(data)
 
     def _checkconfigfile(self):
         """Check the config file.
@@ -84,93 +175,205 @@ class DPManager(object):
         """
         if osp.exists(osp.join(CONFIGDIR, "dpmgr.conf")):
             self._config.read(osp.join(CONFIGDIR, "dpmgr.conf"))
+        sections = self._config.sections()
         if not self._config.has_section("IP"):
             self._config["IP"] = {}
             self._config["IP"]["default"] = "digitalpaper.local"
-        with open(osp.join(CONFIGDIR, "dpmgr.conf"), "w") as f:
-            self._config.write(f)
+        if not self._config.has_section("CACHE"):
+            self._config["CACHE"] = {}
+            # max. age of the cached device contents in seconds
+            self._config["CACHE"]["ttl"] = "300"
+            # refresh an outdated cache folder by folder instead of listing
+            # the whole device, needs one request per folder
+            self._config["CACHE"]["incremental"] = "no"
+            # reuse the session credentials instead of authenticating again
+            self._config["CACHE"]["session"] = "yes"
+            # reuse the address found to answer for that many seconds
+            self._config["CACHE"]["route_ttl"] = "600"
+        if not self._config.has_section("HTTP"):
+            self._config["HTTP"] = {}
+            # retries of idempotent requests and their backoff factor in seconds
+            self._config["HTTP"]["retries"] = "3"
+            self._config["HTTP"]["backoff"] = "0.5"
+            # timeouts in seconds
+            self._config["HTTP"]["connect_timeout"] = "10"
+            self._config["HTTP"]["read_timeout"] = "60"
+            # connections kept open, raised to the number of concurrent transfers
+            self._config["HTTP"]["pool_size"] = "10"
+            # upper bound of the adaptive number of concurrent requests
+            self._config["HTTP"]["max_in_flight"] = "16"
+        # only write the file if sections have been added
+        if self._config.sections() != sections:
+            with open(osp.join(CONFIGDIR, "dpmgr.conf"), "w") as f:
+                self._config.write(f)
+
+    def _configure_session(self):
+        http_config = self._config["HTTP"]
+        self.dp.configure_session(
+            retries=http_config.getint("retries", fallback=3),
+            backoff=http_config.getfloat("backoff", fallback=0.5),
+            timeout=(
+                http_config.getfloat("connect_timeout", fallback=10),
+                http_config.getfloat("read_timeout", fallback=60),
+            ),
+            pool_size=http_config.getint("pool_size", fallback=10),
+            max_in_flight=http_config.getint("max_in_flight", fallback=16),
+        )
 
-    def _interface_up(self, interface):
-        """Check if the net interface is up.
+    def print_session_settings(self):
+        """Print the effective retry, timeout and connection pool settings.
 
         """
-        interface_addrs = psutil.net_if_addrs().get(interface) or []
-        inet6 = socket.AF_INET6 in [snicaddr.family for snicaddr in interface_addrs]
-        inet4 = socket.AF_INET in [snicaddr.family for snicaddr in interface_addrs]
-        return (inet4 or inet6)
+        print("Connection settings:")
+        for key, val in self.dp.session_settings.items():
+            print("  {}: {}".format(key, val))
 
-    def _wait_until_connected(self, interfaces):
-        """Get interfaces to try and return the one connected.
+    def print_concurrency_stats(self):
+        """Print the metrics and the last decisions of the concurrency limiter.
 
         """
-        res = None
-        for iface in interfaces:
-            retry = 0
-            print(f"Connecting to {iface}", end="", flush=True)
-            while (not self._interface_up(iface)) and retry < 50:
-                time.sleep(0.3)
-                retry += 1
-                print(".", end="", flush=True)
-            if self._interface_up(iface):
-                res = iface
-                break
-            print("\n", end="", flush=True)
-        if not res:
-            print("\n")
-            print("Could not connect to the DPT-RP1 via USB, exiting.")
-            sys.exit(1)
-        else:
-            print("\n")
-            return res
+        limiter = self.dp.limiter
+        print("Concurrency:")
+        for key, val in limiter.metrics.items():
+            if isinstance(val, float):
+                val = "{:.2f}".format(val)
+            print("  {}: {}".format(key, val))
+        t0 = None
+        for t, limit, reason in limiter.decisions:
+            if t0 is None:
+                t0 = t
+            print("  +{:.2f} s: limit {} ({})".format(t - t0, limit, reason))
 
     def _get_ip(self, ip):
-        # prefer usb
-        if self._is_usb_conneted():
+        """Find the address the device answers on.
+
+        All candidates are probed concurrently and the first one that accepts
+        a connection is used ("happy eyeballs"). The candidates are the
+        ethernet over USB link if the device is plugged in, every address of
+        the IP section and digitalpaper.local. The winner is cached for
+        route_ttl seconds (CACHE section) and tried first next time. An ip
+        given explicitly is used as is, e.g. to address one of several
+        devices.
+
+        """
+        if ip != "":
+            return ip
+        http_config = self._config["HTTP"]
+        timeout = http_config.getfloat("connect_timeout", fallback=10)
+        candidates = []
+        usb = []
+        if self._config.has_section("USB") and detect.sony_usb_connected():
             self._set_up_eth_usb()
             ip_bare = self._config["USB"]["ipv6"]
-            ifaces = self._config["USB"]["interfaces"]
-            iface = self._wait_until_connected(ifaces.split(","))
-            ip = "[{}%{}]".format(ip_bare, iface)
-            print("Using ethernet over USB with ip {} to connect.".format(ip))
-        elif ip == "":
-            ip = self._config["IP"]["default"]
-            ssids = tools.get_ssids()
-            print("Network info: {}".format(ssids))
-            if ssids is not None:
-                # we are on linux, try to find configured ip
-                for ssid in ssids.values():
-                    if not ssid == "":
-                        if self._config.has_option("IP", ssid):
-                            ip = self._config["IP"][ssid]
-                        else:
-                            print("No custom IP defined for network {}".format(ssid))
-        return ip
-
-    def _is_usb_conneted(self):
-        """use lsusb. **this is linux specific!**
-
-        """
-        res = False
-        device_re = re.compile(
-            "Bus\s+(?P<bus>\d+)\s+Device\s+(?P<device>\d+).+ID\s(?P<id>\w+:\w+)\s(?P<tag>.+)$",
-            re.I,
-        )
-        df = str(subprocess.check_output("lsusb"), encoding="UTF8")
-        devices = []
-        for i in df.split("\n"):
-            if i:
-                info = device_re.match(i)
-                if info:
-                    dinfo = info.groupdict()
-                    dinfo["device"] = "/dev/bus/usb/%s/%s" % (
-                        dinfo.pop("bus"),
-                        dinfo.pop("device"),
-                    )
-                    devices.append(dinfo)
-        for dev in devices:
-            if "Sony Corp" in dev["tag"]:
-                res = True
-        return res
+            for iface in self._config["USB"]["interfaces"].split(","):
+                usb.append("[{}%{}]".format(ip_bare, iface.strip()))
+            candidates += usb
+        candidates += [val for key, val in self._config.items("IP")]
+        candidates.append("digitalpaper.local")
+        # remove duplicates, keep the order
+        candidates = list(dict.fromkeys(candidates))
+
+        route = self._load_route()
+        if route in candidates and self._probe(route, time.monotonic() + 1):
+            addr = route
+        else:
+            print("Probing {}".format(", ".join(candidates)))
+            addr = self._race(candidates, timeout)
+            if addr is None:
+                print(
+                    "ERROR: Cannot connect to the device. USB connected? Wifi on?"
+                )
+                sys.exit(1)
+            self._save_route(addr)
+        if addr in usb:
+            print("Using ethernet over USB with ip {} to connect.".format(addr))
+        return addr
+
+    def _race(self, candidates, timeout):
+        """Probe all candidates concurrently.
+
+        Returns
+        -------
+        string or None
+            The first candidate that accepted a connection, None if none did
+            within timeout seconds.
+
+        """
+        deadline = time.monotonic() + timeout
+        found = threading.Event()
+        winner = []
+        lock = threading.Lock()
+
+        def probe(addr):
+            if self._probe(addr, deadline, found):
+                with lock:
+                    if not winner:
+                        winner.append(addr)
+                found.set()
+
+        # the threads are not joined, the losers give up at the deadline or
+        # as soon as the winner is found
+        for addr in candidates:
+            threading.Thread(target=probe, args=(addr,), daemon=True).start()
+        found.wait(timeout)
+        with lock:
+            return winner[0] if winner else None
+
+    def _probe(self, addr, deadline, found=None):
+        """Try to connect to addr until it answers or the deadline passes.
+
+        Parameters
+        ----------
+        addr : string
+            Address as passed to DigitalPaper, e.g. "[fe80::1%usb0]".
+        deadline : float
+            time.monotonic() after which to give up.
+        found : threading.Event (None)
+            Give up when it is set.
+
+        """
+        host = addr
+        port = 8443
+        if host.startswith("["):
+            host = host[1:].split("]")[0]
+        elif host.count(":") == 1:
+            # an address with a port, see DigitalPaper.base_url
+            host, port = host.split(":")
+            port = int(port)
+        if "%" in host:
+            # link local, wait for the usb interface to come up
+            iface = host.split("%")[1]
+            if not detect.wait_for_interface(iface, deadline - time.monotonic(), found):
+                return False
+        while found is None or not found.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                with socket.create_connection((host, port), timeout=remaining):
+                    return True
+            except OSError:
+                # not up yet or not reachable on this route
+                time.sleep(min(0.3, max(deadline - time.monotonic(), 0)))
+        return False
+
+    def _load_route(self):
+        """The cached address if it is younger than route_ttl, or None.
+
+        """
+        ttl = self._config["CACHE"].getfloat("route_ttl", fallback=600)
+        try:
+            with open(self._route_file) as f:
+                route = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - route.get("timestamp", 0) > ttl:
+            return None
+        return route.get("addr")
+
+    def _save_route(self, addr):
+        with open(self._route_file, "w") as f:
+            json.dump({"timestamp": time.time(), "addr": addr}, f)
 
     def _set_up_eth_usb(self):
         """Set up ethernet usb functionality in linux.
@@ -182,6 +385,8 @@ class DPManager(object):
         The user must be in the group that own /dev/ttyACM0
 
         """
+        import serial
+
         # use RNDIS mode
         #send_val = b"\x01\x00\x00\x01\x00\x00\x00\x01\x00\x04"
 
@@ -210,10 +415,24 @@ class DPManager(object):
                 pass
 
     def _authenticate(self):
+        """Authenticate with the device.
+
+        The credentials of the session are cached per address in
+        ~/.dpmgr/session.json and reused by the next commands, which saves the
+        handshake. When the
+        device rejects them, the handshake is run again transparently.
+
+        """
         with open(self._clientid_file, "r") as f:
             client_id = f.readline().strip()
         with open(self._key_file, "rb") as f:
             key = f.read()
+        if self._config["CACHE"].getboolean("session", fallback=True):
+            self.dp.on_credentials = lambda c: self._save_session(client_id, c)
+            credentials = self._load_session(client_id)
+            if credentials is not None:
+                self.dp.use_credentials(client_id, key, credentials)
+                return
         try:
             res = self.dp.authenticate(client_id, key)
         except requests.exceptions.ConnectionError:
@@ -225,6 +444,49 @@ class DPManager(object):
             )
             sys.exit(1)
 
+    def _read_sessions(self):
+        """The cached sessions, address: {"client_id", "credentials"}.
+
+        """
+        try:
+            with open(self._session_file) as f:
+                sessions = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(sessions, dict):
+            return {}
+        # skips the single session of older versions
+        return {addr: s for addr, s in sessions.items() if isinstance(s, dict)}
+
+    def _load_session(self, client_id):
+        """The cached credentials for this device and client, or None.
+
+        """
+        session = self._read_sessions().get(self.dp.addr)
+        if session is None or session.get("client_id") != client_id:
+            return None
+        return session.get("credentials")
+
+    def _save_session(self, client_id, credentials):
+        """Cache the credentials, readable by the user only.
+
+        The sessions of other addresses are kept.
+
+        """
+        with _session_lock:
+            sessions = self._read_sessions()
+            sessions[self.dp.addr] = {
+                "client_id": client_id,
+                "credentials": credentials,
+            }
+            # unique, other processes may save at the same time; mode 0600
+            fd, tmpfile = tempfile.mkstemp(
+                prefix="session.", suffix=".tmp", dir=osp.dirname(self._session_file)
+            )
+            with os.fdopen(fd, "w") as f:
+                json.dump(sessions, f)
+            os.replace(tmpfile, self._session_file)
+
     def _check_configpath(self):
         if not osp.exists(CONFIGDIR):
             os.mkdir(CONFIGDIR)
@@ -254,9 +516,185 @@ class DPManager(object):
         return data
 
     def _build_tree(self):
-        data = self._get_all_contents()
+        self._set_tree(self._get_all_contents())
+
+    def _set_tree(self, data):
+        """Build the tree from all entries of the device and cache them.
+
+        """
+        from dptrp1manager import remotetree
+
         self._remote_tree = remotetree.RemoteTree()
         self._remote_tree.rebuild_tree(data)
+        self._fingerprints = remotetree.folder_fingerprints(data)
+        self._save_tree_cache(data)
+
+    @property
+    def serial(self):
+        """The serial number of the device.
+
+        """
+        if self._serial is None and self.dp is not None:
+            self._serial = self.dp.get_info()["serial_number"]
+        return self._serial
+
+    def _save_tree_cache(self, data):
+        """Save the contents of the device to the cache file.
+
+        """
+        cache = {
+            "timestamp": time.time(),
+            "serial": self.serial,
+            "entries": data,
+            "fingerprints": self._fingerprints,
+        }
+        tmpfile = self._tree_cache_file + ".tmp"
+        with open(tmpfile, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmpfile, self._tree_cache_file)
+
+    def _load_tree_cache(self, ttl=None, serial=None):
+        """Build the tree from the cache file.
+
+        Parameters
+        ----------
+        ttl : float (None)
+            Max. age of the cache in seconds. No limit if None.
+        serial : string (None)
+            Serial number of the connected device. If given, it must match the
+            one of the cache.
+
+        Returns
+        -------
+        bool
+            True if the tree has been built from the cache.
+
+        """
+        from dptrp1manager import remotetree
+
+        if not osp.exists(self._tree_cache_file):
+            return False
+        try:
+            with open(self._tree_cache_file, "r") as f:
+                cache = json.load(f)
+        except ValueError:
+            return False
+        age = time.time() - cache["timestamp"]
+        if ttl is not None:
+            # an expired cache has its mtime reset, see expire_tree_cache
+            mtime = osp.getmtime(self._tree_cache_file)
+            if time.time() - min(cache["timestamp"], mtime) > ttl:
+                return False
+        if serial is not None and serial != cache["serial"]:
+            return False
+        expired = osp.getmtime(self._tree_cache_file) == 0
+        print(
+            "Using cached contents of the device ({:.0f} s old{})".format(
+                age, ", outdated" if expired else ""
+            )
+        )
+        self._serial = cache["serial"]
+        self._remote_tree = remotetree.RemoteTree()
+        self._remote_tree.rebuild_tree(cache["entries"])
+        # missing in older caches, every folder is then listed once
+        self._fingerprints = cache.get("fingerprints", {})
+        return True
+
+    def refresh_tree(self):
+        """Refresh the tree loaded from the cache incrementally.
+
+        The root folder is listed and its fingerprint compared to the one
+        stored at the last listing. Only if it changed, the subfolders whose
+        entries are new or changed are listed (concurrently) and compared in
+        turn, unchanged subtrees are skipped. The listings of the changed
+        folders are spliced into the tree.
+
+        A change deep down is only found if the device reports it in the
+        entries of the folders above, e.g. by their modification date. Hence
+        this is off by default, see incremental in the CACHE section.
+
+        """
+        self._apply_changed_folders(self._list_changed_folders())
+
+    def _list_changed_folders(self):
+        """List the folders whose fingerprint changed since the last listing.
+
+        Only reads the device, the tree is not touched.
+
+        Returns
+        -------
+        list
+            (folder id, entries) of the changed folders, parents first.
+
+        """
+        from dptrp1manager import remotetree
+
+        tree = self._remote_tree
+        fingerprints = dict(self._fingerprints)
+        list_folder = self.dp.get_directory_entries_byid
+        changed = []
+        self.dp.set_pool_size(self.dp.list_workers)
+        with ThreadPoolExecutor(max_workers=self.dp.list_workers) as executor:
+            queue = deque([("root", executor.submit(list_folder, "root"), False)])
+            while queue:
+                folder_id, future, moved = queue.popleft()
+                entries = future.result()
+                fingerprint = remotetree.entries_fingerprint(entries)
+                if not moved and fingerprints.get(folder_id) == fingerprint:
+                    # unchanged, skip the subtree
+                    continue
+                changed.append((folder_id, entries))
+                for e in entries:
+                    if e["entry_type"] != "folder":
+                        continue
+                    node = tree.get_node_by_id(e["entry_id"])
+                    # a new or moved folder changes the paths of its subtree
+                    child_moved = (
+                        moved or node is None or node.entry_path != e["entry_path"]
+                    )
+                    # otherwise it is listed only if its modification date
+                    # changed, which the device reports for changed contents
+                    if child_moved or node.modified_date != node.todatetime(
+                        e.get("modified_date", None)
+                    ):
+                        future = executor.submit(list_folder, e["entry_id"])
+                        queue.append((e["entry_id"], future, child_moved))
+        return changed
+
+    def _apply_changed_folders(self, changed):
+        """Splice the listings of changed folders into the tree.
+
+        """
+        from dptrp1manager import remotetree
+
+        tree = self._remote_tree
+        for folder_id, entries in changed:
+            node = tree.get_node_by_id(folder_id)
+            if node is None:
+                # removed together with its parent
+                continue
+            tree.update_folder(node, entries)
+            self._fingerprints[folder_id] = remotetree.entries_fingerprint(entries)
+        # forget removed folders
+        self._fingerprints = {
+            folder_id: fingerprint
+            for folder_id, fingerprint in self._fingerprints.items()
+            if tree.get_node_by_id(folder_id) is not None
+        }
+        print("Refreshed {} changed folders".format(len(changed)))
+        if changed:
+            tree.save_contents()
+        self._save_tree_cache(tree.entries())
+
+    def expire_tree_cache(self):
+        """Mark the cache file as outdated after the contents of the device
+        changed.
+
+        It can still be refreshed incrementally and used offline.
+
+        """
+        if osp.exists(self._tree_cache_file):
+            os.utime(self._tree_cache_file, (0, 0))
 
     def rebuild_tree(self):
         """Rebuild the local tree.
@@ -267,19 +705,52 @@ class DPManager(object):
 
     @property
     def remote_tree(self):
+        """The tree of the device contents, read when first needed.
+
+        """
+        if self._remote_tree is None:
+            self._load_tree()
         return self._remote_tree
 
+    def _load_path(self, path):
+        """Build a partial tree with only the folders along path.
+
+        Each folder on the path is listed, one request per level, instead of
+        reading the whole device.
+
+        """
+        from dptrp1manager import remotetree
+
+        parts = self.fix_path(path).split("/")
+        # "root" is the id of the Document folder, the first part of the path
+        listing = self.dp.get_directory_entries_byid("root")
+        entries = list(listing)
+        for depth in range(2, len(parts) + 1):
+            prefix = "/".join(parts[:depth])
+            ids = [
+                e["entry_id"]
+                for e in listing
+                if e["entry_path"] == prefix and e["entry_type"] == "folder"
+            ]
+            if not ids:
+                break
+            # the last folder is listed too, its children are in the tree
+            listing = self.dp.get_directory_entries_byid(ids[0])
+            entries.extend(listing)
+        self._remote_tree = remotetree.RemoteTree()
+        self._remote_tree.rebuild_tree(entries, save_contents=False)
+
     def print_full_tree(self, path):
         path = self.fix_path(path)
-        self._remote_tree.printtree(path, foldersonly=False)
+        self.remote_tree.printtree(path, foldersonly=False)
 
     def print_dir_tree(self, path):
         path = self.fix_path(path)
-        self._remote_tree.printtree(path, foldersonly=True)
+        self.remote_tree.printtree(path, foldersonly=True)
 
     def print_folder_contents(self, path):
         path = self.fix_path(path)
-        self._remote_tree.print_folder_contents(path)
+        self.remote_tree.print_folder_contents(path)
 
     def get_folder_contents(self, folder):
         folder = self.get_node(folder)
@@ -287,7 +758,7 @@ class DPManager(object):
 
     def get_node(self, path):
         path = self.fix_path(path)
-        res = self._remote_tree.get_node_by_path(path)
+        res = self.remote_tree.get_node_by_path(path)
         return res
 
     def node_exists(self, path, print_error=True):
@@ -322,6 +793,12 @@ class DPManager(object):
     def mkdir(self, path):
         """Create a new directory on the DPT-RP1.
 
+        Returns
+        -------
+        DPNode
+            The node of the new folder inserted into the tree or None if no
+            folder has been created.
+
         """
         # skip dot folders
         # skip anything below a dot folder
@@ -332,16 +809,54 @@ class DPManager(object):
         if not isdotpath:
             path = self.fix_path(path)
             parent_folder, new_folder = path.rsplit("/", maxsplit=1)
+            if self._remote_tree is None:
+                self._load_path(parent_folder)
             if self.node_exists(parent_folder):
                 if not self.node_exists(path, print_error=False):
                     print("Creating folder {}".format(path))
                     parent_folder_id = self.get_node(parent_folder).entry_id
-                    self.dp.new_folder_byid(parent_folder_id, new_folder)
+                    self.expire_tree_cache()
+                    folder_id = self.dp.new_folder_byid(parent_folder_id, new_folder)
+                    if folder_id is None:
+                        print("ERROR: Creating folder {} failed".format(path))
+                        return None
+                    return self.remote_tree.insert_folder_node(
+                        {
+                            "entry_path": path,
+                            "entry_name": new_folder,
+                            "entry_id": folder_id,
+                            "created_date": datetime.utcnow(),
+                            "is_new": False,
+                            "parent_folder_id": parent_folder_id,
+                        }
+                    )
                 else:
                     print("ERROR: DPT-RP1 has already a folder {}".format(path))
+            else:
+                print("ERROR: Parent folder {} does not exist".format(parent_folder))
         else:
             print("Skipping 'dot' folder {}".format(path))
 
+    def add_uploaded_document(self, path, doc_id, parent_folder_id, source):
+        """Insert a document uploaded from the local file source into the tree.
+
+        The size is taken from the local file, the dates are set to now.
+
+        """
+        now = datetime.utcnow()
+        return self.remote_tree.insert_document_node(
+            {
+                "entry_path": path,
+                "entry_name": path.rsplit("/", 1)[-1],
+                "entry_id": doc_id,
+                "created_date": now,
+                "is_new": True,
+                "parent_folder_id": parent_folder_id,
+                "file_size": osp.getsize(source),
+                "modified_date": now,
+            }
+        )
+
     def rm_dir(self, path):
         """Delete a (empty) directory on the DPT-RP1.
 
@@ -350,12 +865,14 @@ class DPManager(object):
         if self.node_exists(path):
             print("Deleting dir {}.".format(path))
             dir_id = self.get_node(path).entry_id
-            self._rm_dir(dir_id)
+            if self._rm_dir(dir_id):
+                self.remote_tree.remove_node(path)
         else:
             print("ERROR: Directory {} not found".format(path))
 
     def _rm_dir(self, dir_id):
-        self.dp.delete_directory_byid(dir_id)
+        self.expire_tree_cache()
+        return self.dp.delete_directory_byid(dir_id)
 
     def rm_file(self, path):
         """Delete a file on the DPT-RP1.
@@ -365,12 +882,16 @@ class DPManager(object):
         if self.node_exists(path):
             print("Deleting file {}.".format(path))
             file_id = self.get_node(path).entry_id
-            self._rm_file(file_id)
+            if self._rm_file(file_id):
+                self.remote_tree.remove_node(path)
+            else:
+                print("ERROR: Failed deleting file {}".format(path))
         else:
             print("ERROR: File {} not found".format(path))
 
     def _rm_file(self, file_id):
-        self.dp.delete_document_byid(file_id)
+        self.expire_tree_cache()
+        return self.dp.delete_document_byid(file_id)
 
     def rm(self, path):
         """Delete a file or (empty) directory.
@@ -384,7 +905,7 @@ class DPManager(object):
             else:
                 self.rm_dir(path)
 
-    def rm_allfiles(self, path):
+    def rm_allfiles(self, path, jobs=4):
         """Delete all files in a directory on the DPT-RP1, but do not recurse
         into subdirectories.
 
@@ -392,33 +913,98 @@ class DPManager(object):
         path = self.fix_path(path)
         if self.node_exists(path):
             files = self.get_folder_contents(path)
-            for f in files:
-                if f.entry_type == "document":
-                    self.rm_file(f.entry_path)
+            documents = [f for f in files if f.entry_type == "document"]
+            self._rm_nodes(documents, "file", jobs)
 
-    def rm_allfiles_recursively(self, path):
+    def rm_allfiles_recursively(self, path, jobs=4):
         """Delete all files and folders in a directory on the DPT-RP1. Do not
         delete the directory itself.
 
         """
-        path = self.fix_path(path)
-        if self.node_exists(path):
-            files = self.get_folder_contents(path)
-            for f in files:
-                if f.entry_type == "document":
-                    self.rm_file(f.entry_path)
-                else:
-                    self.rm_allfiles_recursively(f.entry_path)
-                    self.rm_dir(f.entry_path)
+        self._rm_recursively(path, False, jobs)
 
-    def rm_all_recursively(self, path):
+    def rm_all_recursively(self, path, jobs=4):
         """Delete all files and folders in a directory on the DPT-RP1 including
         the directory itself.
 
         """
-        self.rm_allfiles_recursively(path)
-        self.rm_dir(path)
+        self._rm_recursively(path, True, jobs)
+
+    def _rm_recursively(self, path, include_root, jobs):
+        """Delete everything below path.
 
+        The documents and folders to delete are collected from the tree once.
+        The documents are deleted concurrently, then the folders level by
+        level, starting with the deepest.
+
+        """
+        path = self.fix_path(path)
+        if not self.node_exists(path):
+            return
+        import anytree
+
+        root = self.get_node(path)
+        documents = []
+        levels = {}
+        for node in anytree.PreOrderIter(root):
+            if node.entry_type == "document":
+                documents.append(node)
+            elif node.entry_type == "folder" and (include_root or node is not root):
+                levels.setdefault(node.depth, []).append(node)
+        self._rm_nodes(documents, "file", jobs)
+        for depth in sorted(levels, reverse=True):
+            folders = []
+            for node in levels[depth]:
+                if node.children:
+                    # something below could not be deleted
+                    print(
+                        "ERROR: Remote directory {} not empty. "
+                        "Cannot delete it.".format(node.entry_path)
+                    )
+                else:
+                    folders.append(node)
+            self._rm_nodes(folders, "dir", jobs)
+
+    def _rm_nodes(self, nodes, kind, jobs):
+        """Delete documents (kind "file") or empty folders (kind "dir")
+        concurrently.
+
+        The nodes are removed from the tree as their deletion is reported.
+
+        """
+        if not nodes:
+            return
+        self.expire_tree_cache()
+        self.dp.set_pool_size(jobs)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(self._delete, node, kind) for node in nodes]
+            for node, future in zip(nodes, futures):
+                error = future.result()
+                if error is None:
+                    print("Deleting {} {}.".format(kind, node.entry_path))
+                    self.remote_tree.remove_nodes([node])
+                else:
+                    print(
+                        "ERROR: Failed deleting {} {}: {}".format(
+                            kind, node.entry_path, error
+                        )
+                    )
+
+    def _delete(self, node, kind):
+        """Delete a single node, return None on success or the error.
+
+        """
+        try:
+            if kind == "file":
+                ok = self.dp.delete_document_byid(node.entry_id)
+            else:
+                # the tree says the folder is empty, the device checks again
+                ok = self.dp.delete_directory_byid(node.entry_id, check_empty=False)
+            if ok:
+                return None
+            return "request failed"
+        except requests.exceptions.RequestException as e:
+            return e
 
 def main():
     dp_mgr = DPManager()
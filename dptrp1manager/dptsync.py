@@ -36,10 +36,17 @@ CONFIGDIR = osp.join(osp.expanduser("~"), ".dpmgr")
 class Synchronizer(FileTransferHandler):
     """Syncronize the DPT-RP1 with a folder.
 
+    Parameters
+    ----------
+    dp_mgr : DPManager
+    scan_workers : int (1)
+        Number of threads used to scan the local folder.
+
     """
 
-    def __init__(self, dp_mgr):
+    def __init__(self, dp_mgr, scan_workers=1):
         super(Synchronizer, self).__init__(dp_mgr)
+        self.scan_workers = scan_workers
         self._downloader = Downloader(dp_mgr)
         self._uploader = Uploader(dp_mgr)
         self._config = configparser.ConfigParser()
@@ -61,8 +68,9 @@ class Synchronizer(FileTransferHandler):
             self._config["pair1"][
                 "policy"
             ] = "<one of: remote_wins, local_wins, newer, skip>"
-        with open(osp.join(CONFIGDIR, "sync.conf"), "w") as f:
-            self._config.write(f)
+            # write the template only if there is no pair
+            with open(osp.join(CONFIGDIR, "sync.conf"), "w") as f:
+                self._config.write(f)
 
     def sync_pairs(self, policy):
         """Sync the pairs defined in the config file.
@@ -93,6 +101,9 @@ class Synchronizer(FileTransferHandler):
         """
         self._local_root = osp.abspath(osp.expanduser(local))
         self._remote_root = remote
+        # the transfers are journaled by the downloader and uploader
+        self._downloader.journal = self.journal
+        self._uploader.journal = self.journal
         # first compare the current state with the last known one
         print("Comparing remote state to old.")
         deletions_rem, tree_rem = self._cmp_remote2old(local, remote)
@@ -170,8 +181,9 @@ class Synchronizer(FileTransferHandler):
         deleted_nodes = {"documents": [], "folders": []}
 
         oldtree = self._load_sync_state_local(local)
-        curtree = localtree.LocalTree(local)
+        curtree = localtree.LocalTree(local, workers=self.scan_workers)
         curtree.rebuild_tree()
+        self._print_scan_stats(curtree)
         if oldtree is not None:
             # Iterate over all nodes in the old tree first
             for oldnode in PreOrderIter(oldtree.tree):
@@ -196,6 +208,14 @@ class Synchronizer(FileTransferHandler):
         print(deleted_nodes)
         return deleted_nodes, curtree
 
+    def _print_scan_stats(self, tree):
+        stats = tree.scan_stats
+        print(
+            "Scanned {} local entries in {:.2f} s ({:.0f} entries/s)".format(
+                stats["entries"], stats["seconds"], stats["entries_per_second"]
+            )
+        )
+
     def _handle_deletions(self, deletions_loc, deletions_rem, tree_rem, tree_loc):
         """Handle deletion, i.e. delete locally what was deleted remotely and
         the other way around.
@@ -276,11 +296,8 @@ class Synchronizer(FileTransferHandler):
                 #     "Remote node not found. Attempting upload of {}".format(targetpath)
                 # )
                 if node_loc.entry_type == "folder":
+                    # the new node is inserted in the tree of the manager
                     self._dp_mgr.mkdir(targetpath)
-                    conts = self._dp_mgr.dp.list_all()
-                    for nn in conts:
-                        if nn["entry_path"] == targetpath:
-                            tree_rem.insert_folder_node(nn)
                 else:
                     self._uploader.upload_file(
                         node_loc.abspath, targetpath, "local_wins"
@@ -393,13 +410,12 @@ class Synchronizer(FileTransferHandler):
             new.sync_state = "equal"
 
     def _save_sync_state(self, local, remote):
-        # the remote tree
-        self._dp_mgr.rebuild_tree()
+        # the remote tree, kept up to date while syncing
         start_node = self._dp_mgr.get_node(remote)
         fn_loc, fn_rem = self._get_syncstate_paths(local)
         self._dp_mgr.remote_tree.save_to_file(fn_rem, start_node)
         # the local tree
-        loctree = localtree.LocalTree(osp.expanduser(local))
+        loctree = localtree.LocalTree(osp.expanduser(local), workers=self.scan_workers)
         loctree.rebuild_tree()
         loctree.save_to_file(fn_loc)
 
@@ -18,19 +18,33 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from concurrent.futures import ThreadPoolExecutor
 import os
 import os.path as osp
 
+import requests
+
 from dptrp1manager.dptfthandler import FileTransferHandler
 
 
 class Uploader(FileTransferHandler):
     """Manage uploading of files.
 
+    Parameters
+    ----------
+    dp_mgr : DPManager
+    progress : callable (None)
+        Called as progress(source, bytes_sent, bytes_total) during uploads.
+        With jobs > 1 it is called from the worker threads.
+    jobs : int (1)
+        Number of documents uploaded concurrently.
+
     """
 
-    def __init__(self, dp_mgr):
+    def __init__(self, dp_mgr, progress=None, jobs=1):
         super(Uploader, self).__init__(dp_mgr)
+        self._progress = progress
+        self.jobs = jobs
 
     def upload_file(self, source, dest, policy="skip"):
         """Upload a file to the DPT-RP1.
@@ -44,6 +58,23 @@ class Uploader(FileTransferHandler):
         policy : 'remote_wins', 'local_wins', 'newer', 'skip'
             Decide what to do if the file is already present.
 
+        """
+        job = self._prepare_upload(source, dest, policy)
+        if job is not None:
+            self._run_uploads([job])
+
+    def _prepare_upload(self, source, dest, policy):
+        """Check if a file should be uploaded.
+
+        An outdated remote file is not deleted here but by the upload job,
+        right before its replacement is uploaded.
+
+        Returns
+        -------
+        tuple
+            (source, dest, remote id of the target folder, remote id of the
+            outdated file or None) if the file is to be uploaded, else None.
+
         """
         source = osp.expanduser(source)
         dest = self._dp_mgr.fix_path(dest)
@@ -58,6 +89,8 @@ class Uploader(FileTransferHandler):
                     dest_dir = dest[:-1]
                 dest = "{}/{}".format(dest, osp.basename(source))
             dest_dir, dest_fn = dest.rsplit("/", maxsplit=1)
+            if self._journal_completed("upload", source, dest):
+                return None
             if (
                 self._check_policy(policy)
                 and self._dp_mgr.node_exists(dest_dir)
@@ -65,6 +98,7 @@ class Uploader(FileTransferHandler):
                 and self._dp_mgr.file_name_ok(dest)
             ):
                 do_transfer = True
+                replace_id = None
                 if self._dp_mgr.node_exists(dest, print_error=False):
                     if self._check_newer(source, dest) == 0:
                         do_transfer = False
@@ -76,7 +110,7 @@ class Uploader(FileTransferHandler):
                     else:
                         if policy == "local_wins":
                             # delete the old file
-                            self._dp_mgr.rm_file(dest)
+                            replace_id = self._dp_mgr.get_node(dest).entry_id
                             do_transfer = True
                         elif policy == "remote_wins":
                             do_transfer = False
@@ -88,7 +122,7 @@ class Uploader(FileTransferHandler):
                         elif policy == "newer":
                             if self._check_newer(local=source, remote=dest) == 1:
                                 # delete the old file
-                                self._dp_mgr.rm_file(dest)
+                                replace_id = self._dp_mgr.get_node(dest).entry_id
                                 do_transfer = True
                             else:
                                 do_transfer = False
@@ -105,10 +139,104 @@ class Uploader(FileTransferHandler):
                                 )
                             )
                 if do_transfer:
-                    print("Adding file {}".format(dest))
-                    with open(source, "rb") as f:
-                        dest_dir_node = self._dp_mgr.get_node(dest_dir)
-                        self._dp_mgr.dp.upload_byid(f, dest_dir_node.entry_id, dest_fn)
+                    dest_dir_node = self._dp_mgr.get_node(dest_dir)
+                    return source, dest, dest_dir_node.entry_id, replace_id
+        return None
+
+    def _run_uploads(self, jobs):
+        """Upload the prepared jobs, concurrently if jobs > 1.
+
+        The results are reported and added to the tree in the order of the
+        jobs.
+
+        """
+        if not jobs:
+            return
+        self._dp_mgr.expire_tree_cache()
+        if self.journal is not None:
+            for job in jobs:
+                self.journal.plan("upload", job[0], job[1])
+        if self.jobs > 1 and len(jobs) > 1:
+            self._dp_mgr.dp.set_pool_size(self.jobs)
+            # read ahead over a window of the next self.jobs files: the first
+            # ones now, then each upload hints the file self.jobs further on
+            for job in jobs[: self.jobs]:
+                self._read_ahead(job[0])
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = []
+                for i, job in enumerate(jobs):
+                    ahead = None
+                    if i + self.jobs < len(jobs):
+                        ahead = jobs[i + self.jobs][0]
+                    futures.append(executor.submit(self._upload, job, ahead))
+                for job, future in zip(jobs, futures):
+                    self._finish_upload(job, *future.result())
+        else:
+            for job in jobs:
+                print("Adding file {}".format(job[1]))
+                self._finish_upload(job, *self._upload(job), quiet=True)
+
+    def _read_ahead(self, source):
+        """Ask the OS to read a file into the page cache before it is uploaded.
+
+        """
+        if hasattr(os, "posix_fadvise"):
+            try:
+                fd = os.open(source, os.O_RDONLY)
+                try:
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+
+    def _upload(self, job, read_ahead=None):
+        """Upload a single file.
+
+        An outdated remote file is deleted first, the device does not accept
+        two documents with the same name. If read_ahead is given, that file is
+        read into the page cache first.
+
+        Returns
+        -------
+        tuple
+            The document id and None on success, None and the error otherwise.
+            Last a bool, True if the outdated remote file has been deleted.
+
+        """
+        source, dest, dest_dir_id, replace_id = job
+        if read_ahead is not None:
+            self._read_ahead(read_ahead)
+        progress = None
+        if self._progress is not None:
+            progress = lambda sent, total: self._progress(source, sent, total)
+        deleted = False
+        try:
+            if replace_id is not None:
+                if not self._dp_mgr.dp.delete_document_byid(replace_id):
+                    return None, "deleting the old file failed", False
+                deleted = True
+            with open(source, "rb") as f:
+                doc_id = self._dp_mgr.dp.upload_byid(
+                    f, dest_dir_id, dest.rsplit("/", 1)[-1], progress
+                )
+            if self.journal is not None:
+                self.journal.complete("upload", source, dest)
+            return doc_id, None, deleted
+        except (requests.exceptions.RequestException, OSError, KeyError) as e:
+            return None, e, deleted
+
+    def _finish_upload(self, job, doc_id, error, deleted, quiet=False):
+        source, dest, dest_dir_id, _ = job
+        if error is not None:
+            print("ERROR: Failed uploading {}: {}".format(source, error))
+            if deleted:
+                # the outdated file is gone, but nothing replaced it
+                self._dp_mgr.remote_tree.remove_node(dest)
+        else:
+            self._dp_mgr.add_uploaded_document(dest, doc_id, dest_dir_id, source)
+            if not quiet:
+                print("Added file {}".format(dest))
 
     def upload_folder_contents(self, source, dest, policy="skip"):
         """Upload a full folder to the DPT-RP1.
@@ -117,46 +245,54 @@ class Uploader(FileTransferHandler):
         source = osp.expanduser(source)
         dest = self._dp_mgr.fix_path(dest)
         if self._check_policy(policy) and self._local_path_ok(source):
-            src_files = (
-                osp.join(source, fn)
-                for fn in os.listdir(source)
-                if osp.isfile(osp.join(source, fn))
-            )
             if self._dp_mgr.node_exists(dest):
-                for f in src_files:
-                    dest_fn = dest + "/" + osp.basename(f)
-                    self.upload_file(f, dest_fn, policy)
+                jobs = []
+                with os.scandir(source) as it:
+                    for entry in sorted(it, key=lambda e: e.name):
+                        if entry.is_file():
+                            dest_fn = dest + "/" + entry.name
+                            job = self._prepare_upload(entry.path, dest_fn, policy)
+                            if job is not None:
+                                jobs.append(job)
+                self._run_uploads(jobs)
 
     def upload_recursively(self, source, dest, policy="skip"):
         """Upload recursively.
 
+        All missing folders are created first, the files are uploaded
+        afterwards.
+
         """
         source = osp.expanduser(source)
         dest = self._dp_mgr.fix_path(dest)
         if self._check_policy(policy) and self._local_path_ok(source):
             if self._dp_mgr.node_exists(dest):
-                src_files = (
-                    osp.join(source, fn)
-                    for fn in os.listdir(source)
-                    if osp.isfile(osp.join(source, fn))
-                )
-                for f in src_files:
-                    dest_fn = dest + "/" + osp.basename(f)
-                    self.upload_file(f, dest_fn, policy)
-                src_dirs = (
-                    osp.join(source, fn)
-                    for fn in os.listdir(source)
-                    if osp.isdir(osp.join(source, fn))
-                )
-                for d in src_dirs:
-                    if (
-                        not d.startswith(".") and "/." not in d
-                    ):  # no hidden directories.
-                        new_remote_path = dest + "/" + osp.basename(d)
-                        new_local_path = d
-                        if not self._dp_mgr.node_exists(
-                            new_remote_path, print_error=False
-                        ):
-                            self._dp_mgr.mkdir(new_remote_path)
-                            self._dp_mgr.rebuild_tree()
-                        self.upload_recursively(new_local_path, new_remote_path, policy)
+                jobs = []
+                self._prepare_recursively(source, dest, policy, jobs)
+                self._run_uploads(jobs)
+
+    def _prepare_recursively(self, source, dest, policy, jobs):
+        """Create the remote folders below dest and collect the uploads.
+
+        Each local directory is listed once.
+
+        """
+        files = []
+        dirs = []
+        with os.scandir(source) as it:
+            for entry in sorted(it, key=lambda e: e.name):
+                if entry.is_file():
+                    files.append(entry)
+                elif entry.is_dir() and not entry.name.startswith("."):
+                    # no hidden directories.
+                    dirs.append(entry)
+        for f in files:
+            job = self._prepare_upload(f.path, dest + "/" + f.name, policy)
+            if job is not None:
+                jobs.append(job)
+        for d in dirs:
+            new_remote_path = dest + "/" + d.name
+            if not self._dp_mgr.node_exists(new_remote_path, print_error=False):
+                self._dp_mgr.mkdir(new_remote_path)
+            if self._dp_mgr.node_exists(new_remote_path, print_error=False):
+                self._prepare_recursively(d.path, new_remote_path, policy, jobs)
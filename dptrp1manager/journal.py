@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# dptrp1manager, high level tools to interact with the Sony DPT-RP1
+# Copyright © 2018 Christian Gross
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import json
+import os
+import os.path as osp
+import threading
+
+
+CONFIGDIR = osp.join(osp.expanduser("~"), ".dpmgr")
+JOURNALDIR = osp.join(CONFIGDIR, "journal")
+
+
+class TransferJournal(object):
+    """Append-only log of the transfers of a batch operation.
+
+    Every planned transfer and every completed one is written as a line of
+    json to ~/.dpmgr/journal/<hash of key>.log. After a crash, the batch can
+    be resumed and the completed transfers are skipped.
+
+    Parameters
+    ----------
+    key : string
+        Identifies the batch, e.g. the command and its arguments.
+    resume : bool (False)
+        Keep the records of an earlier run of the same batch. Otherwise the
+        journal starts empty.
+
+    """
+
+    def __init__(self, key, resume=False):
+        super(TransferJournal, self).__init__()
+        self.key = key
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        self.path = osp.join(JOURNALDIR, name + ".log")
+        self._planned = set()
+        self._completed = set()
+        self._lock = threading.Lock()
+        if resume:
+            self._load()
+        os.makedirs(JOURNALDIR, exist_ok=True)
+        self._file = open(self.path, "a" if resume else "w")
+        if resume and self._completed:
+            print(
+                "Resuming: {} transfers already completed".format(
+                    len(self._completed)
+                )
+            )
+        else:
+            self._write({"event": "batch", "key": key})
+
+    def _load(self):
+        if not osp.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a line cut short by the crash
+                    continue
+                if record.get("event") == "planned":
+                    self._planned.add(self._item(record))
+                elif record.get("event") == "completed":
+                    self._completed.add(self._item(record))
+
+    def _item(self, record):
+        return (record["kind"], record["source"], record["dest"])
+
+    def _write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+
+    def plan(self, kind, source, dest):
+        """Record a transfer that is about to start.
+
+        """
+        item = (kind, source, dest)
+        if item not in self._planned:
+            self._planned.add(item)
+            self._write(
+                {"event": "planned", "kind": kind, "source": source, "dest": dest}
+            )
+
+    def complete(self, kind, source, dest):
+        """Record a finished transfer.
+
+        """
+        self._completed.add((kind, source, dest))
+        self._write(
+            {"event": "completed", "kind": kind, "source": source, "dest": dest}
+        )
+
+    def is_completed(self, kind, source, dest):
+        return (kind, source, dest) in self._completed
+
+    def close(self):
+        """Close the journal.
+
+        It is removed if all planned transfers were completed, so only
+        unfinished batches can be resumed.
+
+        """
+        self._file.close()
+        if self._planned <= self._completed:
+            os.remove(self.path)
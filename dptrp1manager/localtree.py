@@ -3,6 +3,8 @@
 
 import os
 import os.path as osp
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import anytree
@@ -66,16 +68,26 @@ class LocalTree(object):
 
     """
 
-    def __init__(self, rootpath, tree=None):
+    def __init__(self, rootpath, tree=None, workers=1):
         if osp.basename(rootpath) == "":
             rootpath = osp.dirname(rootpath)
         self._rootpath = osp.abspath(osp.expanduser(rootpath))
         self._tree = tree
         self._resolver = anytree.resolver.Resolver("name")
+        # number of threads listing directories, 1 scans sequentially
+        self._workers = max(1, int(workers))
+        self._scan_stats = None
 
     def rebuild_tree(self):
         self._tree = self._create_tree_root()
-        self._create_tree()
+        t0 = time.perf_counter()
+        nentries = self._create_tree()
+        dt = time.perf_counter() - t0
+        self._scan_stats = {
+            "entries": nentries,
+            "seconds": dt,
+            "entries_per_second": nentries / dt if dt > 0 else float("inf"),
+        }
 
     @property
     def tree(self):
@@ -85,6 +97,14 @@ class LocalTree(object):
     def rootpath(self):
         return self._rootpath
 
+    @property
+    def scan_stats(self):
+        """Statistics of the last scan: number of directory entries seen,
+        duration and throughput in entries per second. None before a scan.
+
+        """
+        return self._scan_stats
+
     def remove_node(self, path):
         node = self.get_node_by_path(path)
         childs = []
@@ -110,39 +130,115 @@ class LocalTree(object):
         return rootnode
 
     def _create_tree(self):
-        """Create the tree by wlking through the file system.
+        """Create the tree by walking through the file system.
+
+        Every directory is listed once with os.scandir and each PDF is stat'ed
+        once. The parent nodes are looked up in a dict keyed by the directory
+        path instead of resolving them in the tree.
 
         """
-        for path, dirs, files in os.walk(self._rootpath):
-            if not path == self._rootpath:
-                parentpath = osp.relpath(osp.dirname(path), osp.dirname(self._rootpath))
-                parentnode = self.get_node_by_path(parentpath)
-                name = osp.basename(path)
-                relpath = osp.relpath(path, osp.dirname(self._rootpath))
-                LocalNode(
-                    parent=parentnode,
-                    name=name,
-                    relpath=relpath,
-                    abspath=path,
-                    entry_type="folder",
-                )
-            for name in files:
-                if osp.splitext(name)[1].lower() == ".pdf":
-                    parentpath = osp.relpath(path, osp.dirname(self._rootpath))
-                    parentnode = self.get_node_by_path(parentpath)
-                    relpath = osp.join(parentpath, name)
-                    abspath = osp.join(path, name)
-                    modtime = datetime.utcfromtimestamp(osp.getmtime(abspath))
-                    fsize = osp.getsize(abspath)
-                    LocalNode(
-                        parent=parentnode,
-                        name=name,
-                        relpath=relpath,
-                        abspath=abspath,
-                        entry_type="document",
-                        file_size=fsize,
-                        modified_date=modtime,
-                    )
+        dirnodes = {self._rootpath: self._tree}
+        if self._workers > 1:
+            return self._create_tree_parallel(dirnodes)
+        nentries = 0
+        stack = [self._rootpath]
+        while stack:
+            path = stack.pop()
+            listing = self._list_dir(path)
+            nentries += listing[0]
+            subdirs = self._add_listing(path, listing, dirnodes)
+            # reversed, such that the directories are visited in listing order
+            stack.extend(reversed(subdirs))
+        return nentries
+
+    def _create_tree_parallel(self, dirnodes):
+        """Create the tree listing several directories concurrently.
+
+        Directories are submitted to the thread pool as soon as they are found.
+        The results are added to the tree in breadth first order, such that
+        the resulting tree does not depend on the timing of the workers.
+
+        """
+        nentries = 0
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            queue = deque(
+                [(self._rootpath, executor.submit(self._list_dir, self._rootpath))]
+            )
+            while queue:
+                path, future = queue.popleft()
+                listing = future.result()
+                nentries += listing[0]
+                for subdir in self._add_listing(path, listing, dirnodes):
+                    queue.append((subdir, executor.submit(self._list_dir, subdir)))
+        return nentries
+
+    def _list_dir(self, path):
+        """List the PDFs and subdirectories of path.
+
+        This does not touch the tree and can be run in a worker thread.
+
+        Returns
+        -------
+        tuple
+            The number of directory entries, a list of (name, path, size,
+            mtime) tuples of the PDFs and a list of the subdirectory paths.
+
+        """
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            return 0, files, subdirs
+        for entry in entries:
+            try:
+                isdir = entry.is_dir()
+            except OSError:
+                isdir = False
+            if isdir:
+                # like os.walk, do not follow symlinks to directories
+                if not entry.is_symlink():
+                    subdirs.append(entry.path)
+            elif osp.splitext(entry.name)[1].lower() == ".pdf":
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files.append((entry.name, entry.path, st.st_size, st.st_mtime))
+        return len(entries), files, subdirs
+
+    def _add_listing(self, path, listing, dirnodes):
+        """Add the nodes of a directory listing to the tree.
+
+        Returns
+        -------
+        list
+            The paths of the subdirectories which still need to be scanned.
+
+        """
+        parentnode = dirnodes[path]
+        _, files, subdirs = listing
+        for name, abspath, fsize, mtime in files:
+            LocalNode(
+                parent=parentnode,
+                name=name,
+                relpath=osp.join(parentnode.relpath, name),
+                abspath=abspath,
+                entry_type="document",
+                file_size=fsize,
+                modified_date=datetime.utcfromtimestamp(mtime),
+            )
+        for subdir in subdirs:
+            name = osp.basename(subdir)
+            dirnodes[subdir] = LocalNode(
+                parent=parentnode,
+                name=name,
+                relpath=osp.join(parentnode.relpath, name),
+                abspath=subdir,
+                entry_type="folder",
+            )
+        return subdirs
 
     def save_to_file(self, path, start_node=None):
         path = osp.expanduser(path)
@@ -1,21 +1,497 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import io
+import json
+import os
+import os.path as osp
+import random
+import threading
+import time
 from urllib.parse import quote_plus
+import uuid
 
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dptrp1.dptrp1 import DigitalPaper
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class MultipartFileStream(object):
+    """A multipart/form-data body with a single file field, read in chunks.
+
+    requests sends objects with read() and __len__ as a stream with a known
+    Content-Length, instead of building the whole body in memory.
+
+    Parameters
+    ----------
+    fh : file
+        File opened in binary mode, read from its current position.
+    field : string
+        Name of the form field.
+    filename : string
+        File name sent in the Content-Disposition header.
+    content_type : string ("application/pdf")
+        Content type of the file part.
+    progress : callable (None)
+        Called as progress(bytes_sent, bytes_total) after every read.
+
+    """
+
+    def __init__(
+        self, fh, field, filename, content_type="application/pdf", progress=None
+    ):
+        self.boundary = uuid.uuid4().hex
+        head = (
+            "--{}\r\n"
+            'Content-Disposition: form-data; name="{}"; filename="{}"\r\n'
+            "Content-Type: {}\r\n\r\n".format(
+                self.boundary, field, filename, content_type
+            )
+        ).encode("utf-8")
+        tail = "\r\n--{}--\r\n".format(self.boundary).encode("utf-8")
+        file_size = os.fstat(fh.fileno()).st_size - fh.tell()
+        self._parts = [io.BytesIO(head), fh, io.BytesIO(tail)]
+        self._len = len(head) + file_size + len(tail)
+        self._sent = 0
+        self._progress = progress
+
+    @property
+    def content_type(self):
+        return "multipart/form-data; boundary={}".format(self.boundary)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        # only used by requests to detect a streamed body
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._len
+        res = b""
+        while self._parts and len(res) < size:
+            chunk = self._parts[0].read(size - len(res))
+            if chunk:
+                res += chunk
+            else:
+                self._parts.pop(0)
+        self._sent += len(res)
+        if self._progress is not None and res:
+            self._progress(self._sent, self._len)
+        return res
+
+
+class JitteredRetry(Retry):
+    """Retry with a randomized exponential backoff.
+
+    The backoff of urllib3 is drawn uniformly from its upper half, so that
+    concurrent requests failing together do not retry in lockstep.
+
+    """
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(backoff / 2, backoff)
+
+
+class AdaptiveLimiter(object):
+    """Limit the number of requests in flight with an AIMD controller.
+
+    The limit grows by one per limit successful requests (additive
+    increase) and is multiplied by `decrease` after an error or a response
+    slower than `latency_factor` times the fastest one seen for the same kind
+    of request (multiplicative decrease). At most one decrease is made per
+    `cooldown` seconds, since the requests in flight fail together.
+
+    Parameters
+    ----------
+    initial : int (4)
+        Limit at the start.
+    minimum : int (1)
+    maximum : int (16)
+    decrease : float (0.5)
+    latency_factor : float (3.0)
+    cooldown : float (1.0)
+
+    """
+
+    def __init__(
+        self,
+        initial=4,
+        minimum=1,
+        maximum=16,
+        decrease=0.5,
+        latency_factor=3.0,
+        cooldown=1.0,
+    ):
+        super(AdaptiveLimiter, self).__init__()
+        self.minimum = minimum
+        self._maximum = maximum
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._baseline = {}
+        self._last_decrease = 0.0
+        self._metrics = {
+            "requests": 0,
+            "errors": 0,
+            "slow": 0,
+            "increases": 0,
+            "decreases": 0,
+            "max_in_flight": 0,
+            "wait_seconds": 0.0,
+        }
+        # the last decisions as (time, limit, reason)
+        self.decisions = deque(maxlen=100)
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    @property
+    def maximum(self):
+        """Upper bound of the limit, lowering it also lowers the limit.
+
+        """
+        return self._maximum
+
+    @maximum.setter
+    def maximum(self, val):
+        with self._cond:
+            self._maximum = val
+            if self._limit > val:
+                self._limit = float(max(val, self.minimum))
+                self.decisions.append((time.monotonic(), self.limit, "maximum"))
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """Wait for a free slot and hold it.
+
+        A thread which already holds a slot gets the same one again.
+
+        """
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            t0 = time.perf_counter()
+            with self._cond:
+                while self._in_flight >= int(self._limit):
+                    self._cond.wait()
+                self._in_flight += 1
+                self._metrics["max_in_flight"] = max(
+                    self._metrics["max_in_flight"], self._in_flight
+                )
+                self._metrics["wait_seconds"] += time.perf_counter() - t0
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if depth == 0:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify()
+
+    def record(self, kind, seconds=None, error=False):
+        """Adjust the limit after a request.
+
+        Parameters
+        ----------
+        kind : hashable
+            The kind of request, latencies are compared within a kind.
+        seconds : float (None)
+            Time to the response, None if it does not say anything about the
+            load of the device (e.g. the upload of a large body).
+        error : bool (False)
+            The request failed or had to be retried.
+
+        """
+        with self._cond:
+            self._metrics["requests"] += 1
+            reason = None
+            if error:
+                self._metrics["errors"] += 1
+                reason = "error"
+            elif seconds is not None:
+                baseline = self._baseline.get(kind)
+                if baseline is None or seconds < baseline:
+                    self._baseline[kind] = seconds
+                elif seconds > self.latency_factor * baseline:
+                    self._metrics["slow"] += 1
+                    reason = "latency"
+            now = time.monotonic()
+            if reason is not None:
+                if now - self._last_decrease > self.cooldown:
+                    self._last_decrease = now
+                    self._limit = max(self.minimum, self._limit * self.decrease)
+                    self._metrics["decreases"] += 1
+                    self.decisions.append((now, self.limit, reason))
+            elif self._limit < self.maximum:
+                before = self.limit
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+                if self.limit > before:
+                    self._metrics["increases"] += 1
+                    self.decisions.append((now, self.limit, "increase"))
+                    self._cond.notify_all()
+
+    @property
+    def metrics(self):
+        """Counters of the requests and decisions, and the current limit.
+
+        """
+        with self._cond:
+            metrics = dict(self._metrics)
+            metrics["limit"] = self.limit
+            metrics["in_flight"] = self._in_flight
+        return metrics
+
+
+class DeviceAdapter(HTTPAdapter):
+    """HTTPAdapter with a default timeout and an adaptive concurrency limit.
+
+    Parameters
+    ----------
+    timeout : tuple or float (None)
+        (connect, read) timeout in seconds, used for requests which do not set
+        one.
+    limiter : AdaptiveLimiter (None)
+        Every request waits for a slot and reports its latency and errors.
+
+    """
+
+    def __init__(self, timeout=None, limiter=None, **kwargs):
+        self.timeout = timeout
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        if self.limiter is None:
+            return super().send(request, timeout=timeout, **kwargs)
+        # e.g. ("GET", "documents")
+        kind = (request.method, request.path_url.split("/")[1].split("?")[0])
+        with self.limiter.slot():
+            t0 = time.perf_counter()
+            try:
+                response = super().send(request, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException:
+                self.limiter.record(kind, error=True)
+                raise
+            seconds = None
+            if request.body is None or isinstance(request.body, (bytes, str)):
+                # the time of a streamed upload depends on its size
+                seconds = time.perf_counter() - t0
+            retries = getattr(response.raw, "retries", None)
+            error = response.status_code >= 500 or bool(
+                retries is not None and retries.history
+            )
+            self.limiter.record(kind, seconds, error)
+        return response
+
 
 class MyDigitalPaper(DigitalPaper):
     """My extension of the DigitalPaper class.
 
+    Attributes
+    ----------
+    list_limit : int
+        Number of entries requested per page when listing the device.
+    list_workers : int
+        Number of concurrent requests when listing the device.
+    listing_stats : dict
+        Number of requests, summed request time and total time of the last
+        listing.
+    retries : int
+        Number of retries of idempotent requests after a connection error or
+        a 502, 503 or 504 response.
+    backoff : float
+        Backoff factor of the retries in seconds.
+    timeout : tuple
+        (connect, read) timeout of every request in seconds.
+    limiter : AdaptiveLimiter
+        Adapts the number of concurrent requests to the load of the device.
+        It is shared by listing, transfers and deletions.
+    on_credentials : callable or None
+        Called with the new credentials after every handshake, e.g. to cache
+        them.
+
     """
 
+    # safe to repeat, uploads (PUT) and creations (POST) are not retried
+    RETRY_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "DELETE"])
+    RETRY_STATUS = (502, 503, 504)
+
     def __init__(self, addr=None):
         super().__init__(addr)
+        self.list_limit = 1000
+        self.list_workers = 4
+        self.listing_stats = {"requests": 0, "request_seconds": 0.0, "seconds": 0.0}
+        self._stats_lock = threading.Lock()
+        self.retries = 3
+        self.backoff = 0.5
+        self.timeout = (10.0, 60.0)
+        self.limiter = AdaptiveLimiter()
+        # default of requests.adapters.HTTPAdapter
+        self._pool_size = 10
+        self._mount_adapter()
+        self.on_credentials = None
+        # client id and key, to repeat the handshake when the device rejects
+        # the credentials
+        self._auth = None
+        self._auth_lock = threading.Lock()
+        self.session.hooks["response"].append(self._reauthenticate)
         # set the time of the dpt-rp1
         self.set_datetime()
 
+    def configure_session(
+        self,
+        retries=None,
+        backoff=None,
+        timeout=None,
+        pool_size=None,
+        max_in_flight=None,
+    ):
+        """Change the retry, timeout, connection pool and concurrency settings.
+
+        Parameters which are None are left unchanged.
+
+        """
+        if retries is not None:
+            self.retries = retries
+        if backoff is not None:
+            self.backoff = backoff
+        if timeout is not None:
+            self.timeout = timeout
+        if pool_size is not None:
+            self._pool_size = pool_size
+        if max_in_flight is not None:
+            self.limiter.maximum = max_in_flight
+        self._mount_adapter()
+
+    def set_pool_size(self, size):
+        """Make sure the session keeps at least size connections open.
+
+        """
+        if size > self._pool_size:
+            self._pool_size = size
+            self._mount_adapter()
+
+    def _mount_adapter(self):
+        retry = JitteredRetry(
+            total=self.retries,
+            backoff_factor=self.backoff,
+            status_forcelist=self.RETRY_STATUS,
+            allowed_methods=self.RETRY_METHODS,
+            raise_on_status=False,
+        )
+        adapter = DeviceAdapter(
+            timeout=self.timeout,
+            limiter=self.limiter,
+            max_retries=retry,
+            pool_connections=self._pool_size,
+            pool_maxsize=self._pool_size,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # reuse the connections
+        self.session.headers["Connection"] = "keep-alive"
+
+    @property
+    def session_settings(self):
+        """The effective retry, timeout and connection pool settings.
+
+        """
+        return {
+            "retries": self.retries,
+            "backoff": self.backoff,
+            "retried_methods": sorted(self.RETRY_METHODS),
+            "retried_status": list(self.RETRY_STATUS),
+            "connect_timeout": self.timeout[0],
+            "read_timeout": self.timeout[1],
+            "pool_size": self._pool_size,
+            "keep_alive": self.session.headers.get("Connection") == "keep-alive",
+            "max_in_flight": self.limiter.maximum,
+        }
+
+    ### Authentication
+
+    def authenticate(self, client_id, key):
+        """Run the challenge/response handshake with the device.
+
+        The client id and key are kept, the handshake is repeated when the
+        device rejects the credentials later on.
+
+        """
+        self._auth = (client_id, key)
+        res = super().authenticate(client_id, key)
+        if self.on_credentials is not None and self.credentials is not None:
+            self.on_credentials(self.credentials)
+        return res
+
+    def use_credentials(self, client_id, key, credentials):
+        """Use the credentials of an earlier session instead of a handshake.
+
+        If the device rejects them, a handshake with client_id and key is run
+        and the request is sent again.
+
+        """
+        self._auth = (client_id, key)
+        self.session.cookies["Credentials"] = credentials
+
+    @property
+    def credentials(self):
+        """The session credentials, None before the handshake.
+
+        """
+        # DigitalPaper.authenticate sets the cookie by hand, without a domain
+        for cookie in self.session.cookies:
+            if cookie.name == "Credentials" and not cookie.domain:
+                return cookie.value
+        return None
+
+    def _reauthenticate(self, r, **kwargs):
+        """Response hook: authenticate again after a 401 and resend the request.
+
+        """
+        if r.status_code != 401 or self._auth is None:
+            return r
+        if "/auth" in r.request.url:
+            return r
+        if r.request.body is not None and not isinstance(r.request.body, (bytes, str)):
+            # a streamed body cannot be sent again
+            return r
+        sent = r.request.headers.get("Cookie", "").split("; ")
+        with self._auth_lock:
+            # unless another thread has renewed the credentials meanwhile
+            if "Credentials={}".format(self.credentials) in sent:
+                self.authenticate(*self._auth)
+        r.content
+        r.close()
+        prep = r.request.copy()
+        prep.headers.pop("Cookie", None)
+        prep.prepare_cookies(self.session.cookies)
+        # only once, a second 401 is returned to the caller
+        prep.hooks = {
+            "response": [h for h in prep.hooks["response"] if h != self._reauthenticate]
+        }
+        return self.session.send(prep, **kwargs)
+
     # file management
 
     def download_byid(self, remote_id):
@@ -25,99 +501,452 @@ class MyDigitalPaper(DigitalPaper):
         response = self.session.get(url)
         return response.content
 
+    def download_byid_to_file(
+        self,
+        remote_id,
+        dest,
+        file_size=None,
+        file_revision=None,
+        chunk_size=1024 * 1024,
+    ):
+        """Download a document directly into a file.
+
+        The response is streamed in chunks into the file dest.part, which is
+        renamed to dest when complete. Memory use does not depend on
+        the document size.
+
+        If the file size and revision of the document are given, they are
+        recorded in the sidecar dest.part.json and an interrupted download is
+        kept. The next call for the same revision continues it with a Range
+        request, or downloads the whole file if the device ignores the range.
+        The part is kept if the request fails and discarded only if the device
+        rejects the range (416 or another Content-Range).
+
+        Returns
+        -------
+        bool
+            True if the download succeeded.
+
+        """
+        url = "/documents/{remote_id}/file".format(remote_id=remote_id)
+        tmpfile = dest + ".part"
+        sidecar = tmpfile + ".json"
+        resumable = file_size is not None and file_revision is not None
+        state = {
+            "entry_id": remote_id,
+            "file_size": file_size,
+            "file_revision": file_revision,
+        }
+        offset = 0
+        if resumable and osp.exists(tmpfile) and self._read_sidecar(sidecar) == state:
+            offset = osp.getsize(tmpfile)
+            if offset > file_size:
+                offset = 0
+        # an existing part is kept if the request fails, e.g. the device is
+        # not reachable yet, and only discarded if the device rejects it
+        keep_part = offset > 0
+        try:
+            if offset > 0 and offset == file_size:
+                # already complete
+                pass
+            else:
+                headers = None
+                if offset > 0:
+                    headers = {"Range": "bytes={}-".format(offset)}
+                # hold the slot of the limiter while the body is read
+                with self.limiter.slot(), self._stream_request(
+                    "GET", url, headers=headers, stream=True
+                ) as response:
+                    content_range = response.headers.get("Content-Range", "")
+                    if response.status_code == 206 and content_range.startswith(
+                        "bytes {}-".format(offset)
+                    ):
+                        print("Resuming download at byte {}".format(offset))
+                        mode = "ab"
+                    elif response.status_code == 200:
+                        # full content, also if the range has been ignored
+                        mode = "wb"
+                    else:
+                        if response.status_code in (206, 416):
+                            # the part does not match the document
+                            keep_part = False
+                        print(
+                            "ERROR: Download failed with status {}".format(
+                                response.status_code
+                            )
+                        )
+                        return False
+                    if resumable:
+                        with open(sidecar, "w") as f:
+                            json.dump(state, f)
+                        keep_part = True
+                    with open(tmpfile, mode) as f:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            f.write(chunk)
+            os.replace(tmpfile, dest)
+            tmpfile = None
+            keep_part = False
+            return True
+        finally:
+            if not keep_part:
+                for fn in (tmpfile, sidecar):
+                    if fn is not None and osp.exists(fn):
+                        os.remove(fn)
+
+    def _read_sidecar(self, path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
     def delete_document_byid(self, remote_id):
-        url = "/documents/{remote_id}".format(remote_id=remote_id)
-        self._delete_endpoint(url)
+        """Delete a document.
+
+        Returns
+        -------
+        bool
+            True if the document has been deleted.
 
-    def delete_directory_byid(self, dir_id):
+        """
+        url = "/documents/{remote_id}".format(remote_id=remote_id)
+        return self._delete_endpoint(url).ok
+
+    def delete_directory_byid(self, dir_id, check_empty=True):
+        """Delete an empty directory.
+
+        Parameters
+        ----------
+        dir_id : string
+        check_empty : bool (True)
+            List the directory first and refuse to delete it if not empty.
+            Without the check the device refuses.
+
+        Returns
+        -------
+        bool
+            True if the directory has been deleted.
+
+        """
+        if not check_empty:
+            return self._delete_endpoint("/folders/{}".format(dir_id)).ok
         data = self.get_directory_contents_byid(dir_id)
         if not "error_code" in data.keys():
             nnodes = data["count"]
             if nnodes == 0:
                 self._delete_endpoint("/folders/{}".format(dir_id))
+                return True
             else:
                 print("ERROR: Remote directory not empty. Cannot delete it.")
+        return False
 
     def get_directory_contents_byid(self, dir_id):
         data = self._get_endpoint("/folders/{}/entries2".format(dir_id)).json()
         return data
 
-    def upload_byid(self, fh, directory_id, remote_filename):
+    def upload_byid(self, fh, directory_id, remote_filename, progress=None):
+        """Upload a file and return the id of the new document.
+
+        The multipart body is streamed from fh in chunks, memory use does not
+        depend on the file size.
+
+        Parameters
+        ----------
+        fh : file
+            File opened in binary mode.
+        directory_id : string
+            Id of the target folder.
+        remote_filename : string
+            Name of the document on the device.
+        progress : callable (None)
+            Called as progress(bytes_sent, bytes_total) while uploading.
+
+        Raises
+        ------
+        requests.exceptions.HTTPError
+            If the device rejects the document or its content. A document
+            created without content is deleted again.
+
+        """
         info = {
             "file_name": remote_filename,
             "parent_folder_id": directory_id,
             "document_source": "",
         }
         r = self._post_endpoint("/documents2", data=info)
-        doc = r.json()
-        doc_id = doc["document_id"]
+        r.raise_for_status()
+        doc_id = r.json()["document_id"]
         doc_url = "/documents/{doc_id}/file".format(doc_id=doc_id)
 
-        files = {"file": (quote_plus(remote_filename), fh, "rb")}
-        self._put_endpoint(doc_url, files=files)
+        body = MultipartFileStream(
+            fh, "file", quote_plus(remote_filename), progress=progress
+        )
+        try:
+            r = self._stream_request(
+                "PUT", doc_url, data=body, headers={"Content-Type": body.content_type}
+            )
+            r.raise_for_status()
+        except requests.exceptions.RequestException:
+            # do not leave an empty document behind
+            try:
+                self.delete_document_byid(doc_id)
+            except requests.exceptions.RequestException:
+                pass
+            raise
+        return doc_id
 
     def new_folder_byid(self, directory_id, remote_foldername):
+        """Create a folder.
+
+        Returns
+        -------
+        string or None
+            The id of the new folder, None if the device refused it.
+
+        """
         info = {"folder_name": remote_foldername, "parent_folder_id": directory_id}
 
         r = self._post_endpoint("/folders2", data=info)
-
-    def _get_highest_level_folder(self, folderdict):
-        res = []
-        for fpath, fentry in folderdict.items():
-            level = len(fpath.split("/"))
-            res.append([level, fentry])
-        return sorted(res, key=lambda xx: xx[0])[0][1]
+        if not r.ok:
+            return None
+        return r.json().get("folder_id")
 
     def list_all(self):
-        # TODO: This is not yet perfect. If folders are to large, entries might be missed.
-        limit = 1000
-
-        # use a dict with paths as keys
-        entrydict = self._get_contents("root", limit)
-
-        if len(entrydict.keys()) >= limit:
-            folders = self._get_folders(entrydict)
-            while folders != {}:
-                cur_folder = self._get_highest_level_folder(folders)
-                # print(cur_folder["entry_path"])
-                # get new folders and append
-                new_entries = self._get_contents(cur_folder["entry_id"], limit)
-                entrydict.update(new_entries)
-                new_folders = self._get_folders(new_entries)
-                # remove folders if new entrydict length below limit, else add
-                # print(len(new_entries.keys()))
-                if len(new_entries.keys()) < limit:
-                    folders.pop(cur_folder["entry_path"])
-                    for ff in new_folders.keys():
-                        folders.pop(ff, None)
-                else:
-                    folders.update(new_folders)
-                    folders.pop(cur_folder["entry_path"])
-        return list(entrydict.values())
-
-    def _get_contents(self, toplevel_folder_id, limit):
-        data = self._get_endpoint(
-            f"/documents2?entry_type=all&limit={limit}&order_type=created_date_asc&origin_folder_id={toplevel_folder_id}"
-        ).json()
+        """List all entries on the device.
+
+        Returns
+        -------
+        list
+            The entries as returned by the API.
+
+        """
+        return list(self.iter_all())
+
+    def iter_all(self):
+        """Iterate over all entries on the device.
+
+        The entries are read in pages from /documents2. Pages after the first
+        are fetched concurrently. If the result is not complete (e.g. the
+        device ignores the offset), the missing entries are collected by
+        listing every folder with entries2. Each entry is yielded only once.
+        Statistics of the requests are stored in `listing_stats`.
+
+        """
+        self.listing_stats = {"requests": 0, "request_seconds": 0.0, "seconds": 0.0}
+        t0 = time.perf_counter()
+        seen = set()
         try:
-            el = data["entry_list"]
-        except KeyError:
+            total = None
+            page = None
+            self.set_pool_size(self.list_workers)
+            with ThreadPoolExecutor(max_workers=self.list_workers) as executor:
+                for page in self._iter_document_pages(executor):
+                    if total is None:
+                        total = self._total_count(page)
+                    for entry in page["entry_list"]:
+                        if entry["entry_id"] not in seen:
+                            seen.add(entry["entry_id"])
+                            yield entry
+                if total is not None:
+                    complete = len(seen) >= total
+                else:
+                    # without a count, the listing is complete if it ended
+                    # with a short page
+                    complete = len(page["entry_list"]) < self.list_limit
+                if not complete:
+                    for entry in self._iter_folder_entries(executor):
+                        if entry["entry_id"] not in seen:
+                            seen.add(entry["entry_id"])
+                            yield entry
+        finally:
+            self.listing_stats["seconds"] = time.perf_counter() - t0
+
+    def _iter_document_pages(self, executor):
+        """Iterate over the pages of /documents2.
+
+        If the total count is known from the first page, the remaining offsets
+        are requested at once, else pages are read until a short one or one
+        without new entries.
+
+        """
+        limit = self.list_limit
+        first = self._get_documents_page(0, limit)
+        yield first
+        total = self._total_count(first)
+        if total is not None:
+            offsets = range(limit, total, limit)
+            for page in executor.map(
+                lambda offset: self._get_documents_page(offset, limit), offsets
+            ):
+                yield page
+        else:
+            last_ids = {e["entry_id"] for e in first["entry_list"]}
+            offset = limit
+            page = first
+            while len(page["entry_list"]) >= limit:
+                page = self._get_documents_page(offset, limit)
+                ids = {e["entry_id"] for e in page["entry_list"]}
+                if ids <= last_ids:
+                    # offset not supported, stop here
+                    break
+                yield page
+                last_ids = ids
+                offset += limit
+
+    def _total_count(self, page):
+        """The total number of entries reported with the first page.
+
+        A full page reporting its own length as count says nothing about
+        the total, None is returned then.
+
+        """
+        count = page.get("count")
+        if count is not None and count == len(page["entry_list"]) == self.list_limit:
+            count = None
+        return count
+
+    def _get_documents_page(self, offset, limit):
+        data = self._get_listing(
+            "/documents2?entry_type=all&limit={}&offset={}"
+            "&order_type=created_date_asc&origin_folder_id=root".format(limit, offset)
+        )
+        if "entry_list" not in data:
             print(data)
-            raise
-        res = dict()
-        for entry in el:
-            res[entry["entry_path"]] = entry
-        return res
+            raise KeyError("entry_list")
+        return data
+
+    def _iter_folder_entries(self, executor):
+        """Iterate over all entries by listing the folders one by one.
+
+        Folders are submitted to the pool as soon as they are found.
+
+        """
+        queue = deque([executor.submit(self.get_directory_entries_byid, "root")])
+        while queue:
+            for entry in queue.popleft().result():
+                if entry["entry_type"] == "folder":
+                    queue.append(
+                        executor.submit(
+                            self.get_directory_entries_byid, entry["entry_id"]
+                        )
+                    )
+                yield entry
 
-    def _get_folders(self, entrydict):
+    def get_directory_entries_byid(self, folder_id):
+        """Get all entries of a single folder, reading all pages.
+
+        """
+        limit = self.list_limit
         res = {}
-        for entry in entrydict.values():
-            if entry["entry_type"] == "folder":
-                res[entry["entry_path"]] = entry
-        return res
+        offset = 0
+        while True:
+            data = self._get_listing(
+                "/folders/{}/entries2?limit={}&offset={}".format(
+                    folder_id, limit, offset
+                )
+            )
+            if "entry_list" not in data:
+                print(data)
+                raise KeyError("entry_list")
+            nbefore = len(res)
+            for entry in data["entry_list"]:
+                res[entry["entry_id"]] = entry
+            offset += limit
+            count = data.get("count")
+            if (
+                len(data["entry_list"]) < limit
+                or len(res) == nbefore
+                or (count is not None and offset >= count)
+            ):
+                break
+        return list(res.values())
+
+    def _stream_request(self, method, endpoint, data=None, headers=None, stream=False):
+        """Like _endpoint_request, but with a raw body, headers and streaming.
+
+        """
+        req = requests.Request(method, self.base_url, data=data, headers=headers)
+        prep = self.session.prepare_request(req)
+        # keep the scope id of ipv6 link local addresses
+        prep.url = prep.url.replace("%25", "%")
+        prep.url += endpoint.lstrip("/")
+        return self.session.send(prep, stream=stream)
+
+    def _get_listing(self, url):
+        """GET a listing endpoint and count the request in listing_stats.
+
+        """
+        t0 = time.perf_counter()
+        data = self._get_endpoint(url).json()
+        dt = time.perf_counter() - t0
+        with self._stats_lock:
+            self.listing_stats["requests"] += 1
+            self.listing_stats["request_seconds"] += dt
+        return data
 
     ### Configuration
 
+    # the settings under /system/configs
+    CONFIGS = ("timeout_to_standby", "owner", "time_format", "date_format", "timezone")
+
+    def get_configs(self, names=None):
+        """Read several settings concurrently.
+
+        Parameters
+        ----------
+        names : iterable (None)
+            Names of the settings, all of CONFIGS if None.
+
+        Returns
+        -------
+        dict
+            name: value
+
+        """
+        names = list(self.CONFIGS if names is None else names)
+        if not names:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            values = executor.map(self._get_config, names)
+            return dict(zip(names, values))
+
+    def set_configs(self, values, verify=True):
+        """Write several settings concurrently.
+
+        Parameters
+        ----------
+        values : dict
+            name: value
+        verify : bool (True)
+            Read the settings back and compare them to values.
+
+        Returns
+        -------
+        dict
+            The settings which were not applied, name: the value on the device
+            or None if the request failed or is not verified.
+
+        """
+        if not values:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(values)) as executor:
+            ok = dict(zip(values, executor.map(self._set_config, values.items())))
+        failed = {name: None for name in values if not ok[name]}
+        if verify:
+            names = [name for name in values if ok[name]]
+            for name, value in self.get_configs(names).items():
+                # the device may answer with another type, e.g. an int
+                if str(value) != str(values[name]):
+                    failed[name] = value
+        return failed
+
+    def _get_config(self, name):
+        return self._get_endpoint("/system/configs/" + name).json()["value"]
+
+    def _set_config(self, item):
+        name, value = item
+        return self._put_endpoint("/system/configs/" + name, data={"value": value}).ok
+
     def get_timeout(self):
         data = self._get_endpoint("/system/configs/timeout_to_standby").json()
         return data["value"]
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 from datetime import datetime
+import hashlib
 import os.path as osp
 import time
 
@@ -11,6 +12,29 @@ from anytree.importer import JsonImporter, DictImporter
 
 from dptrp1manager import tools
 
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# keys of the API entries stored in a DPNode
+ENTRY_KEYS = (
+    "entry_path",
+    "entry_name",
+    "entry_type",
+    "entry_id",
+    "created_date",
+    "is_new",
+    "document_source",
+    "parent_folder_id",
+    "author",
+    "current_page",
+    "document_type",
+    "file_revision",
+    "file_size",
+    "mime_type",
+    "modified_date",
+    "title",
+    "total_page",
+)
+
 
 class DPNode(anytree.NodeMixin):
     """Representation of a general node in the file system of the DPT-RP1.
@@ -115,12 +139,24 @@ class DPNode(anytree.NodeMixin):
 
         self.sync_state = sync_state
 
+    def to_entry(self):
+        """The node data in the format of the API entries.
+
+        """
+        res = {}
+        for key in ENTRY_KEYS:
+            val = getattr(self, key)
+            if isinstance(val, datetime):
+                val = val.strftime(DATE_FORMAT)
+            res[key] = val
+        return res
+
     def todatetime(self, datestring):
         if datestring is not None:
             if isinstance(datestring, datetime):
                 res = datestring
             else:
-                res = datetime.strptime(datestring, "%Y-%m-%dT%H:%M:%SZ")
+                res = datetime.strptime(datestring, DATE_FORMAT)
         else:
             res = None
         return res
@@ -133,14 +169,38 @@ class RemoteTree(object):
 
     def __init__(self, tree=None):
         self._tree = tree
-        self._resolver = anytree.resolver.Resolver("entry_name")
+        # lookup tables entry_path -> node and entry_id -> node
+        self._path_index = {}
+        self._id_index = {}
+        if tree is not None:
+            self._reindex()
 
-    def rebuild_tree(self, jsondata):
+    def rebuild_tree(self, jsondata, save_contents=True):
+        """Build the tree from the entries of the API.
+
+        The list of paths used by the shell completion is saved unless
+        save_contents is False, e.g. for a partial tree.
+
+        """
         self._tree = self._create_tree_root()
+        self._reindex()
+        # Bucket the entries by depth so every parent folder is in the index
+        # before its children are linked to it. This avoids walking the
+        # ancestors of every entry.
+        levels = {}
         for data in jsondata:
-            self._create_path(data["entry_path"])
-            self._create_update_node(data)
+            levels.setdefault(data["entry_path"].count("/"), []).append(data)
+        for level in sorted(levels.keys()):
+            for data in levels[level]:
+                self._create_update_node(data)
         # self.save_to_file("~/.dpmgr/contents.json")
+        if save_contents:
+            self.save_contents()
+
+    def save_contents(self):
+        """Save the list of paths used by the shell completion.
+
+        """
         self._save_content_list("~/.dpmgr/contents")
 
     @property
@@ -196,6 +256,7 @@ class RemoteTree(object):
         node = self.get_node_by_path(path)
         childs = []
         if node is not None:
+            self._unindex_node(node)
             for n in node.parent.children:
                 if n.entry_path == node.entry_path:
                     pass
@@ -203,6 +264,50 @@ class RemoteTree(object):
                     childs.append(n)
             node.parent.children = childs
 
+    def remove_nodes(self, nodes):
+        """Remove the given nodes (with their subtrees) from the tree.
+
+        """
+        for node in nodes:
+            self._unindex_node(node)
+            node.parent = None
+
+    def _reindex(self):
+        """Rebuild the path and id lookup tables from the whole tree.
+
+        The tree may be a subtree of a larger one (see the synchronizer), paths
+        are resolved from the root like the resolver does.
+
+        """
+        self._path_index = {}
+        self._id_index = {}
+        for node in anytree.PreOrderIter(self._tree.root):
+            self._index_node(node)
+
+    def _index_node(self, node):
+        self._path_index[node.entry_path] = node
+        if node.entry_id is not None:
+            self._id_index[node.entry_id] = node
+
+    def _unindex_node(self, node):
+        """Remove a node and all its descendants from the lookup tables.
+
+        """
+        for n in anytree.PreOrderIter(node):
+            if self._path_index.get(n.entry_path) is n:
+                del self._path_index[n.entry_path]
+            if n.entry_id is not None and self._id_index.get(n.entry_id) is n:
+                del self._id_index[n.entry_id]
+
+    def _is_attached(self, node):
+        """Check that an indexed node is still part of this tree.
+
+        Nodes can be shared between several RemoteTree instances and might have
+        been removed through another one.
+
+        """
+        return node.root is self._tree.root
+
     def _create_path(self, path):
         """Create the path to the node if not yet there.
 
@@ -215,7 +320,7 @@ class RemoteTree(object):
             curpath = "{}/{}".format(lastpath, d)
             if self.get_node_by_path(curpath) is None:
                 parent = self.get_node_by_path(lastpath)
-                DPNode(
+                node = DPNode(
                     parent=parent,
                     entry_path=curpath,
                     entry_name=d,
@@ -226,18 +331,29 @@ class RemoteTree(object):
                     document_source=None,
                     parent_folder_id=None,
                 )
+                self._index_node(node)
             lastpath = curpath
 
+    def _get_parent_node(self, path):
+        """Get the parent node of path, creating placeholders if missing.
+
+        """
+        parentpath = path.rsplit("/", 1)[0]
+        parent = self.get_node_by_path(parentpath)
+        if parent is None:
+            self._create_path(path)
+            parent = self.get_node_by_path(parentpath)
+        return parent
+
     def _create_update_node(self, data):
         """Create or update the node given in data.
 
         """
-        parentpath = data["entry_path"].rsplit("/", 1)[0]
-        parent = self.get_node_by_path(parentpath)
+        parent = self._get_parent_node(data["entry_path"])
         if data["entry_type"] == "folder":
             node = self.get_node_by_path(data["entry_path"])
             if node is None:
-                DPNode(
+                node = DPNode(
                     parent=parent,
                     entry_path=data["entry_path"],
                     entry_name=data["entry_name"],
@@ -247,6 +363,7 @@ class RemoteTree(object):
                     is_new=data["is_new"],
                     document_source=data.get("document_source", None),
                     parent_folder_id=data["parent_folder_id"],
+                    modified_date=data.get("modified_date", None),
                 )
             else:
                 # add node data
@@ -256,8 +373,10 @@ class RemoteTree(object):
                 node.is_new = bool(data["is_new"])
                 node.document_source = data.get("document_source", None)
                 node.parent_folder_id = data["parent_folder_id"]
+                node.modified_date = node.todatetime(data.get("modified_date", None))
+            self._index_node(node)
         elif data["entry_type"] == "document":
-            DPNode(
+            node = DPNode(
                 parent=parent,
                 entry_path=data["entry_path"],
                 entry_name=data["entry_name"],
@@ -275,6 +394,7 @@ class RemoteTree(object):
                 title=data.get("title", None),
                 total_page=data["total_page"],
             )
+            self._index_node(node)
 
     def printtree(self, path, foldersonly):
         foldernode = self.get_node_by_path(path)
@@ -317,10 +437,29 @@ class RemoteTree(object):
         """Get a tree node by its path.
 
         """
-        try:
-            searchpath = "/{}".format(path)
-            res = self._resolver.get(self._tree.root, searchpath)
-        except (anytree.resolver.ChildResolverError, anytree.resolver.ResolverError):
+        if self._tree is None:
+            return None
+        res = self._path_index.get(path)
+        if res is None and ("//" in path or path.endswith("/")):
+            # like the resolver, ignore empty path components
+            path = "/".join(comp for comp in path.split("/") if comp)
+            res = self._path_index.get(path)
+        if res is not None and (res.entry_path != path or not self._is_attached(res)):
+            # stale entry
+            del self._path_index[path]
+            res = None
+        return res
+
+    def get_node_by_id(self, entry_id):
+        """Get a tree node by its entry id.
+
+        """
+        if self._tree is None:
+            return None
+        res = self._id_index.get(entry_id)
+        if res is not None and (res.entry_id != entry_id or not self._is_attached(res)):
+            # stale entry
+            del self._id_index[entry_id]
             res = None
         return res
 
@@ -328,9 +467,8 @@ class RemoteTree(object):
         """Insert a folder into the tree.
 
         """
-        parentpath = data["entry_path"].rsplit("/", 1)[0]
-        parent = self.get_node_by_path(parentpath)
-        DPNode(
+        parent = self._get_parent_node(data["entry_path"])
+        node = DPNode(
             parent=parent,
             entry_path=data["entry_path"],
             entry_name=data["entry_name"],
@@ -341,6 +479,146 @@ class RemoteTree(object):
             document_source=data.get("document_source", None),
             parent_folder_id=data["parent_folder_id"],
         )
+        self._index_node(node)
+        return node
+
+    def insert_document_node(self, data):
+        """Insert a document into the tree, e.g. after uploading it.
+
+        A document already present at the same path is replaced.
+
+        """
+        old = self.get_node_by_path(data["entry_path"])
+        if old is not None:
+            self._unindex_node(old)
+            old.parent = None
+        parent = self._get_parent_node(data["entry_path"])
+        node = DPNode(
+            parent=parent,
+            entry_path=data["entry_path"],
+            entry_name=data["entry_name"],
+            entry_type="document",
+            entry_id=data["entry_id"],
+            created_date=data["created_date"],
+            is_new=data["is_new"],
+            document_source=data.get("document_source", None),
+            parent_folder_id=data["parent_folder_id"],
+            author=data.get("author", None),
+            current_page=data.get("current_page", None),
+            document_type=data.get("document_type", None),
+            file_revision=data.get("file_revision", None),
+            file_size=data["file_size"],
+            mime_type=data.get("mime_type", "application/pdf"),
+            modified_date=data["modified_date"],
+            title=data.get("title", None),
+            total_page=data.get("total_page", None),
+        )
+        self._index_node(node)
+        return node
+
+    def entries(self):
+        """All nodes in the format of the API entries, e.g. to cache them.
+
+        Placeholder folders and the root are skipped.
+
+        """
+        res = []
+        for node in anytree.PreOrderIter(self._tree):
+            if node.entry_type is not None and not node.is_root:
+                res.append(node.to_entry())
+        return res
+
+    def folder_fingerprint(self, node):
+        """Fingerprint of the contents of a folder node.
+
+        See `entries_fingerprint`.
+
+        """
+        items = []
+        for c in node.children:
+            modified_date = c.modified_date
+            if modified_date is not None:
+                modified_date = modified_date.strftime(DATE_FORMAT)
+            items.append((c.entry_id, c.entry_name, modified_date))
+        return _fingerprint(items)
+
+    def update_folder(self, node, entries):
+        """Replace the children of a folder node by the given entries.
+
+        Children still present with the same path are kept, such that the
+        subtrees of unchanged folders survive. Everything else is removed or
+        created from the entries.
+
+        """
+        current = {c.entry_id: c for c in node.children}
+        new_ids = set(data["entry_id"] for data in entries)
+        self.remove_nodes([c for c in node.children if c.entry_id not in new_ids])
+        for data in entries:
+            child = current.get(data["entry_id"])
+            if child is not None:
+                if (
+                    child.entry_type == "folder"
+                    and data["entry_type"] == "folder"
+                    and child.entry_path == data["entry_path"]
+                ):
+                    # keep the subtree, only update the folder data
+                    self._create_update_node(data)
+                    continue
+                # changed document or moved folder, replace it
+                self._unindex_node(child)
+                child.parent = None
+            self._create_update_node(data)
+
+
+def _fingerprint(items):
+    """Compute a fingerprint from (entry_id, entry_name, modified_date) tuples.
+
+    The dates are strings in DATE_FORMAT or None. Placeholder nodes without
+    an id are skipped. The fingerprint is a sha1 digest of the sorted tuples,
+    it is the same in every process and can be stored in the cache.
+
+    """
+    items = sorted(
+        (entry_id, entry_name or "", modified_date or "")
+        for entry_id, entry_name, modified_date in items
+        if entry_id is not None
+    )
+    digest = hashlib.sha1()
+    for item in items:
+        digest.update("\0".join(item).encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+def entries_fingerprint(entries):
+    """Fingerprint of a folder computed from its API entries, comparable to
+    `RemoteTree.folder_fingerprint`.
+
+    """
+    return _fingerprint(
+        (e["entry_id"], e["entry_name"], e.get("modified_date", None))
+        for e in entries
+    )
+
+
+def folder_fingerprints(entries):
+    """Fingerprints of all folders, computed from the entries of the device.
+
+    Returns
+    -------
+    dict
+        folder id: fingerprint of its entries, see `entries_fingerprint`.
+
+    """
+    folders = {"root": []}
+    for e in entries:
+        if e["entry_type"] == "folder":
+            folders.setdefault(e["entry_id"], [])
+    for e in entries:
+        folders.setdefault(e.get("parent_folder_id") or "root", []).append(e)
+    return {
+        folder_id: entries_fingerprint(children)
+        for folder_id, children in folders.items()
+    }
 
 
 def load_from_file(path):
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# dptrp1manager, high level tools to interact with the Sony DPT-RP1
+# Copyright © 2018 Christian Gross
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import os
+import threading
+
+import pytest
+import requests
+
+from dptrp1manager.mydptrp1 import UPLOAD_CHUNK_SIZE, MultipartFileStream
+
+
+class _RecordingFile(io.FileIO):
+    """A file remembering the size of every read."""
+
+    def __init__(self, path):
+        super(_RecordingFile, self).__init__(path, "rb")
+        self.reads = []
+
+    def read(self, size=-1):
+        res = super(_RecordingFile, self).read(size)
+        self.reads.append(len(res))
+        return res
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        self.server.requests.append((dict(self.headers), self.rfile.read(length)))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_upload_is_streamed_unchanged(server, tmp_path):
+    content = os.urandom(3 * UPLOAD_CHUNK_SIZE + 123)
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(content)
+    progress = []
+    with _RecordingFile(str(path)) as fh:
+        stream = MultipartFileStream(
+            fh, "file", "doc.pdf", progress=lambda sent, total: progress.append(sent)
+        )
+        r = requests.post(
+            "http://127.0.0.1:{}/documents".format(server.server_address[1]),
+            data=stream,
+            headers={"Content-Type": stream.content_type},
+        )
+    r.raise_for_status()
+
+    # the file was read in chunks, never as a whole
+    assert len(fh.reads) > 1
+    assert max(fh.reads) <= UPLOAD_CHUNK_SIZE
+    assert progress[-1] == len(stream)
+
+    headers, body = server.requests[0]
+    assert int(headers["Content-Length"]) == len(stream) == len(body)
+    assert "Transfer-Encoding" not in headers
+    head, rest = body.split(b"\r\n\r\n", 1)
+    assert head.startswith("--{}\r\n".format(stream.boundary).encode())
+    assert b'filename="doc.pdf"' in head
+    tail = "\r\n--{}--\r\n".format(stream.boundary).encode()
+    assert rest.endswith(tail)
+    assert rest[: -len(tail)] == content
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# dptrp1manager, high level tools to interact with the Sony DPT-RP1
+# Copyright © 2018 Christian Gross
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the startup time of dpmgr for each subcommand.
+
+Every command line is run several times with `python -X importtime`. The
+wall-clock time, the total import time and the slowest imports are reported.
+By default each subcommand is run with --help, which needs no device. Other
+command lines can be given as arguments, e.g. "status -p battery_level".
+
+Save the results with --save and compare a later run with --compare to see
+regressions:
+
+    python tools/bench_startup.py --save before.json
+    python tools/bench_startup.py --compare before.json
+
+"""
+
+import argparse
+import json
+import os
+import os.path as osp
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = osp.dirname(osp.dirname(osp.abspath(__file__)))
+DPMGR = osp.join(ROOT, "bin", "dpmgr")
+
+SUBCOMMANDS = (
+    "upload",
+    "download",
+    "tree",
+    "delete",
+    "mkdir",
+    "sync",
+    "syncpairs",
+    "status",
+    "config",
+    "add-wifi",
+    "delete-wifi",
+    "scan-wifi",
+    "list-wifi",
+    "list-templates",
+    "rename-template",
+    "add-template",
+    "delete-template",
+    "daemon",
+)
+
+
+def parse_importtime(stderr):
+    """Parse the output of -X importtime.
+
+    Returns
+    -------
+    dict
+        Module name: (self time in ms, cumulative time in ms, nesting level).
+
+    """
+    res = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:") :].split("|")
+        if len(fields) != 3:
+            continue
+        name = fields[2].rstrip()
+        # the name is indented by two spaces per level
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        res[name.strip()] = (int(fields[0]) / 1000, int(fields[1]) / 1000, level)
+    return res
+
+
+def run(cmdline, repeat):
+    """Run `dpmgr cmdline` repeat times.
+
+    Returns
+    -------
+    dict
+        Median wall-clock and import time in ms and the imports of the
+        fastest run.
+
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ROOT, env.get("PYTHONPATH", "")])
+    # measure dpmgr itself, not the daemon
+    env["DPMGR_NO_DAEMON"] = "1"
+    argv = [sys.executable, "-X", "importtime", DPMGR] + shlex.split(cmdline)
+    walls = []
+    imports = []
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        proc = subprocess.run(
+            argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        wall = (time.perf_counter() - t0) * 1000
+        modules = parse_importtime(proc.stderr.decode(errors="replace"))
+        walls.append(wall)
+        imports.append(sum(m[0] for m in modules.values()))
+        if best is None or wall < best[0]:
+            best = (wall, modules)
+    return {
+        "wall_ms": statistics.median(walls),
+        "import_ms": statistics.median(imports),
+        "modules": best[1],
+    }
+
+
+def top_imports(modules, n):
+    """The n imports with the largest cumulative time, with their time in ms.
+
+    Only top level imports are ranked, their dependencies are included in the
+    cumulative time.
+
+    """
+    toplevel = [(name, m[1]) for name, m in modules.items() if m[2] == 0]
+    return sorted(toplevel, key=lambda m: m[1], reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the startup time of dpmgr for each subcommand."
+    )
+    parser.add_argument(
+        "cmdlines",
+        nargs="*",
+        help='Command lines to run, e.g. "status". Default: "--help" and '
+        '"<subcommand> --help" for every subcommand.',
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=5, help="Runs per command (default 5)."
+    )
+    parser.add_argument(
+        "-t", "--top", type=int, default=3, help="Imports shown (default 3)."
+    )
+    parser.add_argument("--save", help="Save the results to a json file.")
+    parser.add_argument(
+        "--compare", help="Compare to the results saved in a json file."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=20,
+        help="Percent of slowdown reported as regression (default 20).",
+    )
+    args = parser.parse_args()
+    cmdlines = args.cmdlines
+    if not cmdlines:
+        cmdlines = ["--help"] + ["{} --help".format(c) for c in SUBCOMMANDS]
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    print(
+        "{:<28} {:>9} {:>10}   slowest imports (cumulative ms)".format(
+            "command", "wall ms", "import ms"
+        )
+    )
+    for cmdline in cmdlines:
+        res = run(cmdline, args.repeat)
+        results[cmdline] = {"wall_ms": res["wall_ms"], "import_ms": res["import_ms"]}
+        slowest = ", ".join(
+            "{} {:.1f}".format(name, ms)
+            for name, ms in top_imports(res["modules"], args.top)
+        )
+        line = "{:<28} {:>9.1f} {:>10.1f}".format(
+            cmdline, res["wall_ms"], res["import_ms"]
+        )
+        if cmdline in baseline:
+            old = baseline[cmdline]["wall_ms"]
+            change = 100 * (res["wall_ms"] - old) / old
+            line += " {:+6.1f}%".format(change)
+            if change > args.threshold:
+                regressions.append(cmdline)
+        print("{}   {}".format(line, slowest))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if regressions:
+        print(
+            "REGRESSION: {} slower by more than {:.0f}%".format(
+                ", ".join(regressions), args.threshold
+            )
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()